@@ -1,7 +1,9 @@
 
+import math
 import time
 from motor_ctrl.sync_quad import Dynamixel4, MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID
 from opten_ctrl.opten_lib import Optical4
+from motor_ctrl.pid import PIDService, optical_measure
 
 """
 Change configuration in in motor_ctrl/config_dual.json
@@ -15,50 +17,46 @@ opt.start_burst()
 
 dnx = Dynamixel4()
 dnx.open_port()
-dnx.enable_torque(MOTOR1_ID)
-dnx.enable_torque(MOTOR2_ID)
-dnx.enable_torque(MOTOR3_ID)
-dnx.enable_torque(MOTOR4_ID)
+dnx.enable_torques([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID])
 ##### DONT CHANGE END #####
 
 
 #### Closed-loop Position Control Test ####
 
 # Set the mode and velocity during motion
-dnx.set_mode(MOTOR1_ID, "vel")
-dnx.set_mode(MOTOR2_ID, "vel")
-dnx.set_mode(MOTOR3_ID, "vel")
-dnx.set_mode(MOTOR4_ID, "vel")
+dnx.set_modes({MOTOR1_ID: "vel", MOTOR2_ID: "vel", MOTOR3_ID: "vel", MOTOR4_ID: "vel"})
 
 dnx.define_quadpos0() # Define the current position as the origin
 
 ## Test ##
 print ("Test Starting...")
 
-SETPOINT_1 = 25.4 # mm
-KP, KI, KD = 6., 0.01, 1.
-
-integral = 0
-last_error = 0
+SETPOINTS = {MOTOR1_ID: 25.4, MOTOR2_ID: 25.4, MOTOR3_ID: 25.4, MOTOR4_ID: 25.4} # mm
+# The old loop summed and differenced per sample, PIDService works per second: at 100 Hz its KI of 0.01
+# becomes 0.01 * 100 = 1 and its KD of 1 becomes 1 / 100 = 0.01
+KP, KI, KD = 6., 1., 0.01
+TOLERANCE = 0.1 # mm
+
+# All four segments are controlled together, one encoder snapshot and one velocity write per tick
+readers = [opt.serial_reader1, opt.serial_reader2, opt.serial_reader3, opt.serial_reader4]
+pid = PIDService(dnx, SETPOINTS.keys(), optical_measure(readers), KP, KI, KD, rate=100)
+pid.set_setpoints(SETPOINTS)
+pid.start()
 while True:
-    error = SETPOINT_1 - opt.serial_reader1.y
-    integral += error
-    control = KP * error + KI * integral + KD * (error - last_error)
-    dnx.set_velocity(MOTOR1_ID, control)
-    last_error = error
-    if abs(error) < 0.1:
-        print(f"Motor 1 reached the setpoint: {SETPOINT_1} | Optical Encoder 1: {opt.serial_reader1.y}")
+    time.sleep(0.05)
+    errors = pid.get_errors()
+    controlled = [error for error in errors.values() if not math.isnan(error)] # Segments without an encoder read NaN
+    if controlled and all(abs(error) < TOLERANCE for error in controlled):
+        print(f"Segments reached the setpoints: {SETPOINTS} | Errors: {errors}")
         break
-dnx.set_velocity(MOTOR1_ID, 0)
+pid.stop()
+pid.wait()
 time.sleep(0.5)
 
 
 ##### DONT CHANGE START #####
 opt.close()
 
-dnx.disable_torque(MOTOR1_ID)
-dnx.disable_torque(MOTOR2_ID)
-dnx.disable_torque(MOTOR3_ID)
-dnx.disable_torque(MOTOR4_ID)
+dnx.disable_torques([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID])
 dnx.close_port()
 ##### DONT CHANGE END #####
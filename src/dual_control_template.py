@@ -11,16 +11,14 @@ Check motor_ctrl/sync_dual.py for more info.
 #### DONT CHANGE START ####
 dnx = Dynamixel2()
 dnx.open_port()
-dnx.enable_torque(MOTOR1_ID)
-dnx.enable_torque(MOTOR2_ID)
+dnx.enable_torques([MOTOR1_ID, MOTOR2_ID])
 ##### DONT CHANGE END #####
 
 
 #### Position Control Demo ####
 
 # Set the mode and velocity during motion
-dnx.set_mode(MOTOR1_ID, "extpos")
-dnx.set_mode(MOTOR2_ID, "extpos")
+dnx.set_modes({MOTOR1_ID: "extpos", MOTOR2_ID: "extpos"})
 dnx.set_profile_velocity(MOTOR1_ID, 33) # Set the profile velocity of the motor, 1 mm/s ~= 3.33 unit/s
 dnx.set_profile_velocity(MOTOR2_ID, 33) # Set the profile velocity of the motor, 1 mm/s ~= 3.33 unit/s
 dnx.define_position0(MOTOR1_ID) # Define the current position as 0
@@ -41,7 +39,6 @@ print(f"Moving to Abs Positions: {motor1_pos2}, {motor2_pos2}")
 
 
 ##### DONT CHANGE START #####
-dnx.disable_torque(MOTOR1_ID)
-dnx.disable_torque(MOTOR2_ID)
+dnx.disable_torques([MOTOR1_ID, MOTOR2_ID])
 dnx.close_port()
 ##### DONT CHANGE END #####
@@ -0,0 +1,38 @@
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Brings the hardware up off the GUI thread so the window is shown at once: opens the port, enables
+# torque, runs any extra steps (description, callable) and reads a first telemetry snapshot
+# progress is emitted before each step, then ready with the snapshot, or failed with the error;
+# up is set once the motors are up, before ready is delivered, so a shutdown knows what to undo
+class HardwareBringUp(QThread):
+
+    progress = pyqtSignal(int, str)  # Percent done, description of the current step
+    ready = pyqtSignal(dict)
+    failed = pyqtSignal(str)
+
+    def __init__(self, dnx, motor_ids, telemetry=None, extra_steps=()):
+        super().__init__()
+        self.steps = [("Opening port", dnx.open_port)]
+        self.steps += [("Enabling torque", lambda: dnx.enable_torques(motor_ids))]
+        self.steps += list(extra_steps)
+        self.telemetry = telemetry
+        self.up = False
+
+    def run(self):
+        n_steps = len(self.steps) + 1
+        for i, (description, step) in enumerate(self.steps):
+            self.progress.emit(100 * i // n_steps, description)
+            try:
+                step()
+            except (IOError, RuntimeError) as e:
+                self.failed.emit(f"{description} failed: {e}")
+                return
+        self.progress.emit(100 * len(self.steps) // n_steps, "Reading motor state")
+        try:
+            snapshot = self.telemetry.poll() if self.telemetry is not None else {}
+        except RuntimeError as e:
+            snapshot = {}
+            print(f"Initial telemetry failed: {e}")
+        self.up = True
+        self.progress.emit(100, "Ready")
+        self.ready.emit(snapshot)
@@ -0,0 +1,180 @@
+import math
+
+import numpy as np
+import pyqtgraph as pg
+from PyQt5.QtCore import QTimer
+from PyQt5.QtWidgets import QComboBox, QHBoxLayout, QLabel, QVBoxLayout, QWidget
+
+# Telemetry fields plotted by the strip chart, one plot each
+CHART_FIELDS = ["position", "velocity", "current", "temperature"]
+
+# Visible span options (s), None = whole history
+CHART_WINDOWS = {"30 s": 30, "5 min": 300, "1 h": 3600, "All": None}
+
+# Preallocated ring of timestamped samples, each sample is an array of the given shape
+# Nothing is allocated on append, old samples are overwritten once the ring is full
+class RingBuffer:
+
+    def __init__(self, capacity, shape, dtype=np.float32):
+        self.capacity = capacity
+        self.t = np.zeros(capacity)
+        self.data = np.full((capacity, *shape), np.nan, dtype=dtype)
+        self.head = 0  # Index the next sample is written to
+        self.count = 0
+
+    def append(self, t, sample):
+        self.t[self.head] = t
+        self.data[self.head] = sample
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    # Time of the oldest sample held
+    def start(self):
+        if self.count < self.capacity:
+            return self.t[0] if self.count else math.inf
+        return self.t[self.head]
+
+    # Returns (t, data) of the samples at or after t0, oldest first
+    # Only the requested tail is copied, so short windows stay cheap on a long ring
+    def since(self, t0):
+        if self.count < self.capacity:
+            i = np.searchsorted(self.t[:self.count], t0)
+            return self.t[i:self.count], self.data[i:self.count]
+        if self.head and t0 >= self.t[0]:
+            i = np.searchsorted(self.t[:self.head], t0)
+            return self.t[i:self.head], self.data[i:self.head]
+        i = self.head + np.searchsorted(self.t[self.head:], t0)
+        return (np.concatenate((self.t[i:], self.t[:self.head])),
+                np.concatenate((self.data[i:], self.data[:self.head])))
+
+
+# Min/max decimation along axis 0: every bin of samples is replaced by its min and its max,
+# so spikes survive at any zoom level and the output never exceeds max_points samples
+# lo and hi are the same array for raw data, or per-block minima/maxima of a coarser level
+def decimate_minmax(t, lo, hi, max_points):
+    bins = max(max_points // 2, 1)
+    k = math.ceil(len(t) / bins)
+    if k <= 1:
+        if lo is hi:
+            return t, lo
+        return interleave(t, lo, hi)
+    m = len(t) // k * k
+    t_b = t[:m:k]
+    lo_b = lo[:m].reshape(-1, k, *lo.shape[1:]).min(axis=1)
+    hi_b = hi[:m].reshape(-1, k, *hi.shape[1:]).max(axis=1)
+    if m < len(t):
+        t_b = np.append(t_b, t[m])
+        lo_b = np.concatenate((lo_b, lo[m:].min(axis=0, keepdims=True)))
+        hi_b = np.concatenate((hi_b, hi[m:].max(axis=0, keepdims=True)))
+    return interleave(t_b, lo_b, hi_b)
+
+
+def interleave(t, lo, hi):
+    y = np.empty((2 * len(t), *lo.shape[1:]), dtype=lo.dtype)
+    y[0::2] = lo
+    y[1::2] = hi
+    return np.repeat(t, 2), y
+
+
+# Scrolling plots of telemetry history, one plot per field and one curve per motor
+# Raw samples are kept for the short windows, a min/max level with one entry per block of
+# samples covers the long ones, so hours of history render at the same cost as seconds
+class StripChart(QWidget):
+
+    def __init__(self, motor_ids, rate=20, fields=CHART_FIELDS, raw_span=300, history=4*3600,
+                 max_points=2000, refresh_rate=10):
+        super().__init__()
+        self.motor_ids = list(motor_ids)
+        self.fields = list(fields)
+        self.max_points = max_points
+        shape = (len(self.fields), len(self.motor_ids))
+
+        self.block = max(int(rate), 1)  # Samples per min/max entry, about 1 s
+        self.raw = RingBuffer(int(raw_span * rate) + self.block, shape)
+        self.coarse = RingBuffer(int(history * rate / self.block), (2, *shape))
+        self.block_t = None
+        self.block_lo = np.full(shape, np.inf, dtype=np.float32)
+        self.block_hi = np.full(shape, -np.inf, dtype=np.float32)
+        self.block_count = 0
+        self.last_t = None
+
+        self.initUI()
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(int(1000 / refresh_rate))
+
+    def initUI(self):
+        window_box = QHBoxLayout()
+        window_box.addWidget(QLabel("Plot Window"))
+        self.window_input = QComboBox()
+        self.window_input.addItems(CHART_WINDOWS)
+        self.window_input.currentTextChanged.connect(self.refresh)
+        window_box.addWidget(self.window_input)
+        window_box.addStretch()
+
+        self.plot_widget = pg.GraphicsLayoutWidget()
+        self.curves = []
+        first_plot = None
+        for i, field in enumerate(self.fields):
+            plot = self.plot_widget.addPlot(row=i, col=0)
+            plot.setLabel("left", field.capitalize())
+            plot.showGrid(x=True, y=True, alpha=0.3)
+            if first_plot is None:
+                first_plot = plot
+                plot.addLegend(offset=(5, 5))
+            else:
+                plot.setXLink(first_plot)
+            curves = []
+            for j, motor_id in enumerate(self.motor_ids):
+                curves.append(plot.plot(pen=pg.intColor(j, hues=len(self.motor_ids)), name=f"ID {motor_id}"))
+            self.curves.append(curves)
+        plot.setLabel("bottom", "Time (s)")
+
+        box = QVBoxLayout(self)
+        box.addLayout(window_box)
+        box.addWidget(self.plot_widget)
+        box.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(box)
+        self.setMinimumHeight(150 * len(self.fields))
+
+    # Appends a telemetry snapshot {"time": t, field: {motor_id: value}}, fields missing are NaN
+    def append_snapshot(self, snapshot):
+        sample = np.array([[snapshot.get(field, {}).get(motor_id, np.nan) for motor_id in self.motor_ids]
+                           for field in self.fields], dtype=np.float32)
+        self.append(snapshot["time"], sample)
+
+    def append(self, t, sample):
+        self.raw.append(t, sample)
+        self.last_t = t
+        if self.block_t is None:
+            self.block_t = t
+        np.fmin(self.block_lo, sample, out=self.block_lo)
+        np.fmax(self.block_hi, sample, out=self.block_hi)
+        self.block_count += 1
+        if self.block_count == self.block:
+            self.coarse.append(self.block_t, np.stack((self.block_lo, self.block_hi)))
+            self.block_t = None
+            self.block_lo[:] = np.inf
+            self.block_hi[:] = -np.inf
+            self.block_count = 0
+
+    # Returns decimated (t, y) for the visible window, t is relative to the latest sample
+    def visible(self):
+        span = CHART_WINDOWS[self.window_input.currentText()]
+        t0 = -math.inf if span is None else self.last_t - span
+        # The raw ring is used as long as it reaches back far enough or holds everything recorded
+        if t0 >= self.raw.start() or self.raw.start() <= self.coarse.start():
+            t, y = self.raw.since(t0)
+            t, y = decimate_minmax(t, y, y, self.max_points)
+        else:
+            t, y = self.coarse.since(t0)
+            t, y = decimate_minmax(t, y[:, 0], y[:, 1], self.max_points)
+        return t - self.last_t, y
+
+    def refresh(self):
+        if self.last_t is None or not self.isVisible():
+            return
+        t, y = self.visible()
+        for i, curves in enumerate(self.curves):
+            for j, curve in enumerate(curves):
+                curve.setData(t, y[:, i, j], connect="finite")
@@ -0,0 +1,63 @@
+import time
+
+# Max refresh rate (Hz) per telemetry field, None = render every change
+# Slow-moving readings are throttled so they don't flicker or cost repaints
+DISPLAY_RATES = {
+    "position": None,
+    "velocity": None,
+    "target": None,
+    "current": 10,
+    "voltage": 1,
+    "temperature": 1
+}
+
+# Flattens a telemetry snapshot {field: {motor_id: value}} into {(field, motor_id): value}
+def flatten_snapshot(snapshot):
+    values = {}
+    for field, per_motor in snapshot.items():
+        if isinstance(per_motor, dict):
+            for motor_id, value in per_motor.items():
+                values[(field, motor_id)] = value
+    return values
+
+
+class FieldBinding:
+
+    def __init__(self, widget, fmt, max_rate):
+        self.widget = widget
+        self.fmt = fmt
+        self.period = 1 / max_rate if max_rate else 0
+        self.text = None
+        self.last_render = float("-inf")
+
+
+# Keeps the last rendered text of every bound widget and only calls setText when it changes
+# A throttled field keeps showing its old text until its period has passed, then catches up
+class ViewModel:
+
+    def __init__(self, rates=DISPLAY_RATES):
+        self.rates = rates
+        self.bindings = {}
+
+    # Binds a key, e.g. ("position", motor_id), to a widget with a setText method
+    def bind(self, key, widget, fmt=str, max_rate=None):
+        if max_rate is None and isinstance(key, tuple):
+            max_rate = self.rates.get(key[0])
+        self.bindings[key] = FieldBinding(widget, fmt, max_rate)
+
+    # Renders the values that changed since the last render, returns the number of widgets touched
+    def update(self, values, now=None):
+        now = time.monotonic() if now is None else now
+        touched = 0
+        for key, value in values.items():
+            binding = self.bindings.get(key)
+            if binding is None:
+                continue
+            text = binding.fmt(value)
+            if text == binding.text or now - binding.last_render < binding.period:
+                continue
+            binding.widget.setText(text)
+            binding.text = text
+            binding.last_render = now
+            touched += 1
+        return touched
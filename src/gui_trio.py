@@ -2,76 +2,100 @@
 import sys
 import time
 
-from inputs import get_gamepad
 from motor_ctrl.sync_trio import Dynamixel3, MOTOR1_ID, MOTOR2_ID, MOTOR3_ID
+from motor_ctrl.telemetry import TelemetryThread
+from motor_ctrl.multi_port import multi_port
+from motor_ctrl.remote import TelemetryServer
+from motor_ctrl.io_daemon import DaemonDynamixel
+from motor_ctrl.command_bus import CommandBus, CommandSender
+from motor_ctrl.gamepad import GamepadReader, GamepadStreamer, gamepad_connected
+from gui_ctrl.view_model import ViewModel, flatten_snapshot
+from gui_ctrl.strip_chart import StripChart
+from gui_ctrl.bring_up import HardwareBringUp
+from motor_ctrl.session_log import SessionLogger
+from motor_ctrl.replay import ReplayDynamixel, ReplaySession
 
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
 DEFAULT_KEY_SPEED = 33
-GAMEPAD_SCALER = 1/500
-
-class GamepadThread(QThread):
-
-    def __init__(self, dnx, motor_switches, motor_vel_values):
-        super().__init__()
-        self.dnx = dnx
-        self.motor_switches = motor_switches
-        self.motor_vel_values = motor_vel_values
-        self.deadvel = 10
-
-    def run(self): 
-        while True:
-            events = get_gamepad()
-            for event in events:
-                if event.code == 'ABS_Y':
-                    drive_value = int(event.state * GAMEPAD_SCALER)
-                    if abs(drive_value) < self.deadvel:
-                        drive_value = 0
-                    self.motor_vel_values[0].setText(str(drive_value))
-                elif event.code == 'ABS_RY':
-                    drive_value = int(event.state * GAMEPAD_SCALER)
-                    if abs(drive_value) < self.deadvel:
-                        drive_value = 0
-                    self.motor_vel_values[1].setText(str(drive_value))
-                elif event.code == 'ABS_X':
-                    drive_value = int(event.state * GAMEPAD_SCALER)
-                    if abs(drive_value) < self.deadvel:
-                        drive_value = 0
-                    self.motor_vel_values[2].setText(str(drive_value))
-                elif event.code == 'ABS_RX':
-                    drive_value = int(event.state * GAMEPAD_SCALER)
-                    if abs(drive_value) < self.deadvel:
-                        drive_value = 0
-                    self.motor_vel_values[3].setText(str(drive_value))
-                elif event.code == 'BTN_START' and event.state == 1:
-                    self.motor_switches[0].toggle()
-                elif event.code == 'BTN_SELECT' and event.state == 1:
-                    self.motor_switches[1].toggle()
-                elif event.code == 'BTN_MODE' and event.state == 1:
-                    self.motor_switches[2].toggle()
-                elif event.code == 'BTN_THUMBL' and event.state == 1:
-                    self.motor_switches[3].toggle()
-
+GAMEPAD_RATE = 200 # Hz, rate at which shaped stick values are streamed
+GAMEPAD_MAX_VEL = 65 # Velocity at full stick deflection
+GAMEPAD_DEADBAND = 0.15 # Fraction of full stick
+GAMEPAD_EXPO = 0.3 # 0 = linear, 1 = cubic
+GAMEPAD_SLEW = 400 # Max change of velocity per second
+GAMEPAD_SWITCHES = {'BTN_START': 0, 'BTN_SELECT': 1, 'BTN_MODE': 2, 'BTN_THUMBL': 3}
+TELEMETRY_RATE = 20 # Hz
+COMMAND_RATE = 50 # Hz, max rate of batched velocity writes
 
 class MainWindow(QWidget):
 
-    def __init__(self):
+    def __init__(self, dnx=None, serve=False):
         super(MainWindow, self).__init__()
-        self.dnx = Dynamixel3()
-        self.dnx.open_port()
-        self.dnx.enable_torque(MOTOR1_ID)
-        self.dnx.enable_torque(MOTOR2_ID)
-        self.dnx.enable_torque(MOTOR3_ID)
+        self.dnx = dnx or multi_port(Dynamixel3) # A ReplayDynamixel replays a recorded session instead
 
         self.motor_switches = [QCheckBox() for _ in range(4)]
         self.motor_vel_values = [QLineEdit('0') for _ in range(4)]
 
+        self.bus = CommandBus()
+        self.command_sender = CommandSender(self.dnx, self.bus, rate=COMMAND_RATE)
+        self.session_logger = None
+        self.faults = {}  # Shown by show_faults
+
         self.initUI()
-        if self.have_gamepad():
-            self.gamepad_thread = GamepadThread(
-                self.dnx, self.motor_switches, self.motor_vel_values)
-            self.gamepad_thread.start()
+        self.bind_view()
+        self.telemetry = TelemetryThread(self.dnx, [MOTOR1_ID, MOTOR2_ID, MOTOR3_ID], rate=TELEMETRY_RATE)
+        self.server = TelemetryServer(self.telemetry, self.bus, rate=TELEMETRY_RATE) if serve else None
+        self.telemetry.updated.connect(self.render_telemetry)
+        self.telemetry.updated.connect(self.chart.append_snapshot)
+        self.telemetry.faulted.connect(self.show_faults)
+        self.gamepad_reader, self.gamepad_streamer = None, None
+        self.bring_up = HardwareBringUp(self.dnx, [MOTOR1_ID, MOTOR2_ID, MOTOR3_ID], self.telemetry)
+        self.bring_up.progress.connect(self.show_progress)
+        self.bring_up.ready.connect(self.start_control)
+        self.bring_up.failed.connect(self.show_failure)
+        self.setEnabled(False) # No keys or switches until the motors are up
+        self.bring_up.start()
+
+    # Starts polling, sending and the gamepad once the hardware is up
+    def start_control(self, snapshot):
+        if snapshot:
+            self.render_telemetry(snapshot)
+            self.chart.append_snapshot(snapshot)
+        self.telemetry.start()
+        self.command_sender.start()
+        if self.server is not None:
+            self.server.start()
+        if gamepad_connected():
+            self.gamepad_reader = GamepadReader()
+            self.gamepad_reader.button_pressed.connect(self.toggle_switch)
+            self.gamepad_streamer = GamepadStreamer(self.gamepad_reader, self.bus, [MOTOR1_ID, MOTOR2_ID, MOTOR3_ID], rate=GAMEPAD_RATE,
+                                                    max_vel=GAMEPAD_MAX_VEL, deadband=GAMEPAD_DEADBAND, expo=GAMEPAD_EXPO, slew=GAMEPAD_SLEW)
+            self.gamepad_reader.start()
+            self.gamepad_streamer.start()
+        self.progress_bar.hide()
+        self.setEnabled(True)
+        self.setFocus()
+
+    def show_progress(self, percent, description):
+        self.progress_bar.setValue(percent)
+        self.progress_bar.setFormat(f"{description} (%p%)")
+
+    def show_failure(self, message):
+        print(message)
+        self.progress_bar.setFormat(message)
+        QMessageBox.warning(self, 'Warning', f'{message}\nCheck the connection and restart the GUI.')
+
+    # Unticks the torque switch of a motor the driver holds off after a hardware alert and warns once
+    def show_faults(self, faults):
+        switches = dict(zip([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID], self.motor_switches))
+        for motor_id in sorted(set(faults) - set(self.faults)):
+            if motor_id in switches:
+                switches[motor_id].blockSignals(True)  # Its torque is off already
+                switches[motor_id].setChecked(False)
+                switches[motor_id].blockSignals(False)
+            QMessageBox.warning(self, 'Warning', f'ID {motor_id} {faults[motor_id]}, its torque is off.\nFix the cause, then tick its switch to enable it again.')
+        self.faults = faults
 
     def initUI(self):
         motor_box = QHBoxLayout()
@@ -86,6 +110,9 @@ class MainWindow(QWidget):
             motor_box.addLayout(layout)
 
         box = QVBoxLayout(self)
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setFormat("Starting (%p%)")
+        box.addWidget(self.progress_bar)
         box.addLayout(motor_box)
 
         speed_box = QHBoxLayout()
@@ -97,15 +124,16 @@ class MainWindow(QWidget):
         
         speed_box.addWidget(speed_label)
         speed_box.addWidget(self.speed_input)
+        self.record_switch = QCheckBox("Record Session")
+        self.record_switch.toggled.connect(self.set_recording)
+        speed_box.addWidget(self.record_switch)
         speed_box.setContentsMargins(0, 15, 0, 0)
 
         box.addLayout(speed_box)
-        self.setLayout(box)
 
-        self.timer = QTimer()
-        self.timer.setInterval(50)
-        self.timer.timeout.connect(self.update_values)
-        self.timer.start()
+        self.chart = StripChart([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID], rate=TELEMETRY_RATE)
+        box.addWidget(self.chart)
+        self.setLayout(box)
 
         QApplication.setStyle(QStyleFactory.create('Fusion'))
         self.setWindowTitle("3-DoF Control GUI")
@@ -118,6 +146,7 @@ class MainWindow(QWidget):
         label = QLabel(label_text)
         label.setStyleSheet("font-size: 10pt")
         motor_switch.setChecked(True)
+        motor_switch.toggled.connect(lambda checked: self.set_torque(motor_id, checked))
         label_box.addWidget(label)
         label_box.addStretch(1)
         label_box.addWidget(motor_switch)
@@ -132,7 +161,7 @@ class MainWindow(QWidget):
         pos_box = QHBoxLayout()
         pos_label = QLabel("Position")
         pos_label.setFixedWidth(80)
-        pos_value = QLineEdit(str(self.dnx.get_position(motor_id)))
+        pos_value = QLineEdit()
         pos_value.setReadOnly(True)
         pos_box.addWidget(pos_label)
         pos_box.addWidget(pos_value)
@@ -146,7 +175,7 @@ class MainWindow(QWidget):
         voltage_box = QHBoxLayout()
         voltage_label = QLabel("Voltage / V")
         voltage_label.setFixedWidth(80)
-        voltage_value = QLineEdit(str(self.dnx.get_voltage(motor_id)))
+        voltage_value = QLineEdit()
         voltage_value.setReadOnly(True)
         voltage_box.addWidget(voltage_label)
         voltage_box.addWidget(voltage_value)
@@ -160,7 +189,7 @@ class MainWindow(QWidget):
         current_box = QHBoxLayout()
         current_label = QLabel("Current / mA")
         current_label.setFixedWidth(80)
-        current_value = QLineEdit(str(self.dnx.get_current(motor_id)))
+        current_value = QLineEdit()
         current_value.setReadOnly(True)
         current_box.addWidget(current_label)
         current_box.addWidget(current_value)
@@ -174,7 +203,7 @@ class MainWindow(QWidget):
         temp_box = QHBoxLayout()
         temp_label = QLabel("Temp / °C")
         temp_label.setFixedWidth(80)
-        temp_value = QLineEdit(str(self.dnx.get_temperature(motor_id)))
+        temp_value = QLineEdit()
         temp_value.setReadOnly(True)
         temp_box.addWidget(temp_label)
         temp_box.addWidget(temp_value)
@@ -194,36 +223,51 @@ class MainWindow(QWidget):
 
         return motor_box
 
-    def have_gamepad(self):
-        try:
-            get_gamepad()
-        except:
-            print("No gamepad found")
-            return False
-        return True
-
-    def update_values(self):
+    def toggle_switch(self, code):
+        if code in GAMEPAD_SWITCHES:
+            self.motor_switches[GAMEPAD_SWITCHES[code]].toggle()
+
+    # Ticking the switch of a faulted motor clears its fault
+    def set_torque(self, motor_id, enable):
+        if enable:
+            if not self.dnx.clear_faults([motor_id]):
+                self.dnx.enable_torque(motor_id)
+        else:
+            self.dnx.disable_torque(motor_id)
+
+    # Starts or stops recording telemetry snapshots and sent commands to a session folder
+    def set_recording(self, enable):
+        if enable:
+            self.session_logger = SessionLogger()
+            self.session_logger.define_telemetry(self.telemetry.fields, self.telemetry.motor_ids)
+            self.session_logger.start()
+            self.telemetry.updated.connect(self.session_logger.log_snapshot)
+            self.command_sender.logger = self.session_logger
+            print(f"Recording session to {self.session_logger.path}")
+        elif self.session_logger is not None:
+            self.command_sender.logger = None
+            self.telemetry.updated.disconnect(self.session_logger.log_snapshot)
+            self.session_logger.stop()
+            self.session_logger.wait()
+            print(f"Session saved to {self.session_logger.path}")
+            self.session_logger = None
+
+    # Binds the display widgets to telemetry keys so only changed fields are redrawn
+    def bind_view(self):
+        self.view = ViewModel()
         for i, motor_id in enumerate([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID]):
-            switch = self.motor_switches[i]
-            if switch.isChecked() != getattr(self, f'motor{i+1}_switch_last', None):
-                setattr(self, f'motor{i+1}_switch_last', switch.isChecked())
-                if switch.isChecked():
-                    self.dnx.enable_torque(motor_id)
-                else:
-                    self.dnx.disable_torque(motor_id)
-
-            self.dnx.set_velocity(motor_id, int(self.motor_vel_values[i].text()))
-
-        for i, motor_id in enumerate([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID]):
-            pos_value = getattr(self, f'motor{i+1}_pos_value')
-            voltage_value = getattr(self, f'motor{i+1}_voltage_value')
-            current_value = getattr(self, f'motor{i+1}_current_value')
-            temp_value = getattr(self, f'motor{i+1}_temp_value')
-
-            pos_value.setText(str(self.dnx.get_position(motor_id)))
-            voltage_value.setText(str(self.dnx.get_voltage(motor_id)))
-            current_value.setText(str(self.dnx.get_current(motor_id)))
-            temp_value.setText(str(self.dnx.get_temperature(motor_id)))
+            self.view.bind(("target", motor_id), self.motor_vel_values[i])
+            self.view.bind(("position", motor_id), getattr(self, f'motor{i+1}_pos_value'))
+            self.view.bind(("voltage", motor_id), getattr(self, f'motor{i+1}_voltage_value'))
+            self.view.bind(("current", motor_id), getattr(self, f'motor{i+1}_current_value'))
+            self.view.bind(("temperature", motor_id), getattr(self, f'motor{i+1}_temp_value'))
+
+    # Renders the latest telemetry snapshot, no bus I/O happens here
+    def render_telemetry(self, snapshot):
+        values = flatten_snapshot(snapshot)
+        for motor_id in [MOTOR1_ID, MOTOR2_ID, MOTOR3_ID]:
+            values[("target", motor_id)] = self.bus.target(motor_id)
+        self.view.update(values)
 
     def keyPressEvent(self, event):
         try:
@@ -235,15 +279,13 @@ class MainWindow(QWidget):
         adjusted_speed = int(speed_value * boost_multiplier)
 
         if event.key() == Qt.Key_W:
-            self.motor_vel_values[0].setText(str(adjusted_speed))
-            self.motor_vel_values[1].setText(str(adjusted_speed))
+            self.bus.post_many({MOTOR1_ID: adjusted_speed, MOTOR2_ID: adjusted_speed})
         elif event.key() == Qt.Key_S:
-            self.motor_vel_values[0].setText(str(-adjusted_speed))
-            self.motor_vel_values[1].setText(str(-adjusted_speed))
+            self.bus.post_many({MOTOR1_ID: -adjusted_speed, MOTOR2_ID: -adjusted_speed})
         elif event.key() == Qt.Key_A:
-            self.motor_vel_values[2].setText(str(adjusted_speed))
+            self.bus.post(MOTOR3_ID, adjusted_speed)
         elif event.key() == Qt.Key_D:
-            self.motor_vel_values[2].setText(str(-adjusted_speed))
+            self.bus.post(MOTOR3_ID, -adjusted_speed)
 
         elif event.key() == Qt.Key_T:
             self.motor_switches[0].toggle()
@@ -252,22 +294,33 @@ class MainWindow(QWidget):
         elif event.key() == Qt.Key_U:
             self.motor_switches[2].toggle()
         elif event.key() == Qt.Key_Escape:
-            QApplication.quit()
+            self.close()  # Runs closeEvent, which stops the threads and motors
 
     def keyReleaseEvent(self, event):
+        if event.isAutoRepeat():
+            return
         if event.key() in [Qt.Key_W, Qt.Key_S]:
-            self.motor_vel_values[0].setText('0')
-            self.motor_vel_values[1].setText('0')
+            self.bus.post_many({MOTOR1_ID: 0, MOTOR2_ID: 0})
         elif event.key() in [Qt.Key_D, Qt.Key_A]:
-            self.motor_vel_values[2].setText('0')
+            self.bus.post(MOTOR3_ID, 0)
 
     def closeEvent(self, event):
-        if self.have_gamepad():
-            self.gamepad_thread.terminate()
-        self.dnx.disable_torque(MOTOR1_ID)
-        self.dnx.disable_torque(MOTOR2_ID)
-        self.dnx.disable_torque(MOTOR3_ID)
-        self.dnx.close_port()
+        self.bring_up.wait()
+        if self.gamepad_streamer is not None:
+            self.gamepad_streamer.stop()
+            self.gamepad_streamer.wait()
+            self.gamepad_reader.terminate() # Blocked in get_gamepad until the next event
+        if self.server is not None:
+            self.server.stop()
+            self.server.wait()
+        self.command_sender.stop()
+        self.command_sender.wait()
+        self.set_recording(False)
+        self.telemetry.stop()
+        self.telemetry.wait()
+        if self.bring_up.up:
+            self.dnx.disable_torques([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID])
+            self.dnx.close_port()
         QApplication.quit()
 
 
@@ -290,5 +343,10 @@ app = QApplication.instance()
 if app is None:
     app = QApplication([])
 app.setStyleSheet(stylesheet)
-window = MainWindow()
+dnx = None
+if "--replay" in sys.argv: # python src/gui_<SETUP>.py --replay exports/sessions/<session>
+    dnx = ReplayDynamixel(ReplaySession(sys.argv[sys.argv.index("--replay") + 1]))
+elif "--daemon" in sys.argv: # Start python src/motor_ctrl/io_daemon.py trio first
+    dnx = DaemonDynamixel()
+window = MainWindow(dnx, serve="--serve" in sys.argv) # --serve publishes the telemetry, see motor_ctrl/remote.py
 app.exec_()
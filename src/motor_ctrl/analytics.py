@@ -0,0 +1,150 @@
+import argparse
+import csv
+import glob
+import os
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+try:
+    from motor_ctrl.session_log import SESSION_DIR, load_session
+    from motor_ctrl.motion_profile import velocity_ticks
+    from motor_ctrl.estimator import TICKS_PER_MM
+    from motor_ctrl.config import ConfigFile
+except ImportError:  # Run as a script from src/motor_ctrl
+    from session_log import SESSION_DIR, load_session
+    from motion_profile import velocity_ticks
+    from estimator import TICKS_PER_MM
+    from config import ConfigFile
+
+CLAMP_CONFIG = ConfigFile('config_clamp.json')  # The config of sync_clamp, read here without the Dynamixel SDK
+SUMMARY_COLUMNS = ["session", "motor_id", "duration", "cycles", "cycle_time", "commanded_mm", "motor_mm", "optical_mm",
+                   "slip_ratio", "slip_per_cycle_mm", "clamp_current_peak"]
+
+
+# MOTOR5_ID and MOTOR6_ID of config_clamp.json, read when called so edits to the config are picked up;
+# every other motor drives a segment
+def default_clamp_ids():
+    config = CLAMP_CONFIG.load()
+    return (config["MOTOR5_ID"], config["MOTOR6_ID"])
+
+
+# Returns (start, end) row indices of the runs where moving is True, end exclusive
+def motion_runs(moving):
+    edges = np.diff(np.concatenate([[0], moving.astype(np.int8), [0]]))
+    return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+
+# Travel (mm) of each motor from its velocity commands, every command holds until the next one or until end
+# commands is the (time, motor_id, velocity) array of the command stream
+def commanded_travel(commands, motor_ids, end, ticks_per_mm=TICKS_PER_MM):
+    travel = np.full(len(motor_ids), np.nan)
+    for i, motor_id in enumerate(motor_ids):
+        rows = commands[commands[:, 1] == motor_id]
+        if len(rows):
+            hold = np.diff(np.append(rows[:, 0], max(end, rows[-1, 0])))
+            travel[i] = np.sum(velocity_ticks(rows[:, 2]) * hold) / ticks_per_mm
+    return travel
+
+
+# Metrics of one recorded session, returns one row per segment motor as a dict of SUMMARY_COLUMNS
+# A cycle is one run of samples during which any segment motor moves, cycle_time is the mean time
+# between the starts of consecutive cycles; slip is motor travel minus optical travel
+# clamp_ids defaults to default_clamp_ids()
+def analyse_session(path, clamp_ids=None, ticks_per_mm=TICKS_PER_MM):
+    clamp_ids = default_clamp_ids() if clamp_ids is None else clamp_ids
+    session = load_session(path)
+    telemetry = session.get("telemetry")
+    if telemetry is None or len(telemetry) < 2:
+        return []
+    columns = telemetry.columns
+    motor_ids = [int(column.split("_")[1]) for column in columns if column.startswith("position_")]
+    segment_ids = [motor_id for motor_id in motor_ids if motor_id not in clamp_ids]
+    present_clamps = [motor_id for motor_id in motor_ids if motor_id in clamp_ids]
+
+    def field(name, ids):
+        return np.stack([telemetry.column(f"{name}_{motor_id}") if f"{name}_{motor_id}" in columns
+                         else np.full(len(telemetry), np.nan) for motor_id in ids], axis=1)
+
+    t = telemetry.column("time")
+    position = field("position", segment_ids)
+    moving = np.any(np.nan_to_num(np.abs(field("velocity", segment_ids))) > 0, axis=1)
+    starts, ends = motion_runs(moving)
+    ends = np.minimum(ends, len(t) - 1)
+    cycle_time = np.diff(t[starts]).mean() if len(starts) > 1 else np.nan
+
+    # Optical travel of segment i comes from stream optical<i + 1>, interpolated onto the telemetry times
+    optical = np.full_like(position, np.nan)
+    for i in range(len(segment_ids)):
+        stream = session.get(f"optical{i + 1}")
+        if stream is not None and len(stream):
+            optical[:, i] = np.interp(t, stream.column("time"), stream.column("y"))
+
+    motor_mm = (position[-1] - position[0]) / ticks_per_mm
+    optical_mm = optical[-1] - optical[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slip_ratio = np.where(motor_mm != 0, (motor_mm - optical_mm) / motor_mm, np.nan)
+    cycle_slip = (position[ends] - position[starts]) / ticks_per_mm - (optical[ends] - optical[starts])
+    slip_per_cycle = cycle_slip.mean(axis=0) if len(starts) else np.full(len(segment_ids), np.nan)
+
+    commands = session.get("command")
+    commanded_mm = (commanded_travel(commands.data(), segment_ids, t[-1], ticks_per_mm)
+                    if commands is not None and len(commands) else np.full(len(segment_ids), np.nan))
+
+    # Peak |current| of the clamp motors while they move, i.e. while clamping or releasing
+    clamp_current_peak = np.nan
+    if present_clamps:
+        clamp_current = np.abs(field("current", present_clamps))
+        clamping = np.nan_to_num(np.abs(field("velocity", present_clamps))) > 0
+        if clamping.any():
+            clamp_current_peak = np.nanmax(np.where(clamping, clamp_current, np.nan))
+
+    name = os.path.basename(os.path.normpath(path))
+    return [dict(zip(SUMMARY_COLUMNS, [name, motor_id, t[-1] - t[0], len(starts), cycle_time, *values, clamp_current_peak]))
+            for motor_id, *values in zip(segment_ids, commanded_mm, motor_mm, optical_mm, slip_ratio, slip_per_cycle)]
+
+
+# Analyses the session folders in parallel on a process pool and writes the rows to out (CSV)
+# Sessions that cannot be read are reported and skipped
+def analyse_sessions(paths, out=None, clamp_ids=None, workers=None):
+    clamp_ids = default_clamp_ids() if clamp_ids is None else clamp_ids
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {path: pool.submit(analyse_session, path, clamp_ids) for path in paths}
+        for path, future in futures.items():
+            try:
+                rows.extend(future.result())
+            except (OSError, ValueError, KeyError) as e:
+                print(f"Skipped {path}: {e}")
+    if out:
+        with open(out, 'w', newline='') as out_file:
+            writer = csv.DictWriter(out_file, fieldnames=SUMMARY_COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+# Mean of every metric per segment motor over all sessions, printed as a table
+def print_summary(rows):
+    metrics = SUMMARY_COLUMNS[2:]
+    print("motor " + " ".join(f"{metric:>18}" for metric in metrics))
+    for motor_id in sorted({row["motor_id"] for row in rows}):
+        values = np.array([[row[metric] for metric in metrics] for row in rows if row["motor_id"] == motor_id], dtype=float)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # Metrics that are NaN in every session
+            means = np.nanmean(values, axis=0)
+        print(f"{motor_id:>5} " + " ".join(f"{mean:>18.3f}" for mean in means))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarise recorded sessions")
+    parser.add_argument("sessions", nargs="*", help=f"Session folders, default all of {SESSION_DIR}")
+    parser.add_argument("--out", default=os.path.join(SESSION_DIR, "summary.csv"), help="Summary CSV file")
+    parser.add_argument("--clamps", type=int, nargs="*", default=None, help="Clamp motor IDs, default MOTOR5_ID and MOTOR6_ID of config_clamp.json")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes, default one per CPU")
+    args = parser.parse_args()
+
+    paths = args.sessions or sorted(os.path.dirname(manifest) for manifest in glob.glob(os.path.join(SESSION_DIR, "*", "manifest.json")))
+    rows = analyse_sessions(paths, args.out, None if args.clamps is None else tuple(args.clamps), args.workers)
+    print(f"{len(paths)} sessions, {len(rows)} rows written to {args.out}")
+    print_summary(rows)
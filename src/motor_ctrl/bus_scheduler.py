@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Traffic classes, a lower value gets the bus first
+ESTOP, CONTROL, MOTION, TELEMETRY = range(4)
+PRIORITY_NAMES = {ESTOP: "estop", CONTROL: "control", MOTION: "motion", TELEMETRY: "telemetry"}
+# Share of bus time each class may use over BUDGET_WINDOW, None = unlimited
+# A class over its budget still gets an idle bus but gives way to every class within budget
+BUDGETS = {ESTOP: None, CONTROL: None, MOTION: 0.3, TELEMETRY: 0.5}
+BUDGET_WINDOW = 0.5  # s
+
+_local = threading.local()
+
+
+# Traffic class of the calling thread, CONTROL unless set with priority()
+def current_priority():
+    return getattr(_local, "priority", CONTROL)
+
+
+# Runs the block with every bus transaction of this thread in the given class, e.g. a telemetry thread
+# wraps its loop in priority(TELEMETRY); works with any driver, a plain lock just ignores it
+@contextmanager
+def priority(level):
+    previous = current_priority()
+    _local.priority = level
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+# Drop-in for the driver lock that grants the bus by traffic class instead of arrival order
+# Each `with lock:` is one transaction (a packet and its replies); when the bus is freed the waiter
+# within budget with the most urgent class goes next, ties in arrival order, so a control write waits
+# at most for the one transaction in flight, never behind a queue of telemetry reads
+class BusScheduler:
+
+    def __init__(self, budgets=BUDGETS, window=BUDGET_WINDOW):
+        self.budgets = budgets
+        self.window = window
+        self.condition = threading.Condition(threading.Lock())
+        self.owner = None  # Waiter entry [priority, seq] holding the bus
+        self.waiting = []
+        self.seq = 0
+        self.usage = {level: deque() for level in PRIORITY_NAMES}  # (end, duration) of recent transactions
+        self.busy = {level: 0.0 for level in PRIORITY_NAMES}  # Sum of the durations in usage
+        self.counters = {level: {"transactions": 0, "busy": 0.0, "waited": 0.0, "max_wait": 0.0} for level in PRIORITY_NAMES}
+        self.granted = None
+
+    def _over_budget(self, level, now):
+        usage = self.usage[level]
+        while usage and usage[0][0] < now - self.window:
+            self.busy[level] -= usage.popleft()[1]
+        budget = self.budgets.get(level)
+        return budget is not None and self.busy[level] > budget * self.window
+
+    def acquire(self, level=None):
+        level = current_priority() if level is None else level
+        requested = time.monotonic()
+        with self.condition:
+            entry = [level, self.seq]
+            self.seq += 1
+            if self.owner is None and not self.waiting:
+                self.owner = entry
+            else:
+                self.waiting.append(entry)
+                while self.owner is not entry:
+                    self.condition.wait()
+            now = time.monotonic()
+            counters = self.counters[level]
+            counters["transactions"] += 1
+            counters["waited"] += now - requested
+            counters["max_wait"] = max(counters["max_wait"], now - requested)
+            self.granted = now
+        return True
+
+    def release(self):
+        with self.condition:
+            now = time.monotonic()
+            level = self.owner[0]
+            self.usage[level].append((now, now - self.granted))
+            self.busy[level] += now - self.granted
+            self.counters[level]["busy"] += now - self.granted
+            if self.waiting:
+                self.owner = min(self.waiting, key=lambda entry: (self._over_budget(entry[0], now), entry[0], entry[1]))
+                self.waiting.remove(self.owner)
+                self.condition.notify_all()
+            else:
+                self.owner = None
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    # Returns {class name: counters}: transactions, total bus time (s), total and worst wait (s) for the bus
+    def get_stats(self):
+        with self.condition:
+            return {PRIORITY_NAMES[level]: dict(counters) for level, counters in self.counters.items()}
@@ -0,0 +1,197 @@
+import argparse
+import importlib
+import time
+
+import numpy as np
+from dynamixel_sdk import COMM_SUCCESS, GroupSyncRead, GroupSyncWrite
+try:
+    from motor_ctrl.sync_dual import ADDR, LEN  # Same control table for every setup
+except ImportError:  # Run as a script from src/motor_ctrl
+    from sync_dual import ADDR, LEN
+
+# Driver module and class of each setup, as in the GUIs
+SETUPS = {
+    "dual": ("sync_dual", "Dynamixel2"),
+    "trio": ("sync_trio", "Dynamixel3"),
+    "quad": ("sync_quad", "Dynamixel4"),
+    "clamp": ("sync_clamp", "Dynamixel6"),
+}
+# Baud Rate register values; 4.5 Mbps is left out as the SDK port handler cannot set it
+BAUD_RATES = {9600: 0, 57600: 1, 115200: 2, 1000000: 3, 2000000: 4, 3000000: 5, 4000000: 6}
+SWITCH_DELAY = 0.05  # Time (s) given to the motors to change baud before they are pinged
+
+
+# Returns the driver module and driver class of the setup
+def load_setup(setup):
+    module_name, class_name = SETUPS[setup]
+    try:
+        module = importlib.import_module(f"motor_ctrl.{module_name}")
+    except ImportError:  # Run as a script from src/motor_ctrl
+        module = importlib.import_module(module_name)
+    return module, getattr(module, class_name)
+
+
+# Returns the driver module and a driver instance of the setup
+def load_driver(setup):
+    module, driver_class = load_setup(setup)
+    return module, driver_class()
+
+
+def set_port_baud(dnx, baud):
+    with dnx.lock:
+        if not dnx.port_handler.setBaudRate(baud):
+            raise IOError(f"Failed to set baudrate {baud}")
+
+
+# Returns the IDs of motor_ids that answer a ping at the current port baud
+def ping_all(dnx, motor_ids):
+    found = []
+    for motor_id in motor_ids:
+        with dnx.lock:
+            _, comm_result, _ = dnx.packet_handler.ping(dnx.port_handler, motor_id)
+        if comm_result == COMM_SUCCESS:
+            found.append(motor_id)
+    return found
+
+
+# Broadcast pings at every baud, returns {baud: [motor_id]} of the bauds where motors answered
+def scan(dnx, bauds=BAUD_RATES):
+    found = {}
+    for baud in bauds:
+        set_port_baud(dnx, baud)
+        with dnx.lock:
+            data, comm_result = dnx.packet_handler.broadcastPing(dnx.port_handler)
+        if comm_result == COMM_SUCCESS and data:
+            found[baud] = sorted(data)
+    return found
+
+
+# Writes one byte register of several motors in a sync write, which has no status packet, so it also
+# reaches motors that will not answer at the new settings
+def write_byte(dnx, motor_ids, address, value):
+    sync_write = GroupSyncWrite(dnx.port_handler, dnx.packet_handler, address, 1)
+    for motor_id in motor_ids:
+        sync_write.addParam(motor_id, [value])
+    with dnx.lock:
+        comm_result = sync_write.txPacket()
+    if comm_result != COMM_SUCCESS:
+        raise IOError(f"Writing address {address} failed: {dnx.packet_handler.getTxRxResult(comm_result)}")
+
+
+# Moves the motors (at the current port baud) and the port to baud, returns True if all of them answer after
+def switch_baud(dnx, motor_ids, baud):
+    write_byte(dnx, motor_ids, ADDR["BAUD_RATE"], BAUD_RATES[baud])
+    time.sleep(SWITCH_DELAY)
+    set_port_baud(dnx, baud)
+    return sorted(ping_all(dnx, motor_ids)) == sorted(motor_ids)
+
+
+# Finds the motors at whatever baud they are and moves them all to baud
+def recover(dnx, motor_ids, baud):
+    for found_baud, found_ids in scan(dnx).items():
+        found_ids = [motor_id for motor_id in found_ids if motor_id in motor_ids]
+        if found_ids and found_baud != baud:
+            set_port_baud(dnx, found_baud)
+            write_byte(dnx, found_ids, ADDR["BAUD_RATE"], BAUD_RATES[baud])
+            time.sleep(SWITCH_DELAY)
+    set_port_baud(dnx, baud)
+    return sorted(ping_all(dnx, motor_ids)) == sorted(motor_ids)
+
+
+# Times n sync reads of PRESENT_POSITION from all motors, one read is one bus transaction
+# Returns transactions/s, mean and worst round trip (ms) and the number of failed reads
+def measure(dnx, motor_ids, n=200):
+    sync_read = GroupSyncRead(dnx.port_handler, dnx.packet_handler, ADDR["PRESENT_POSITION"], LEN["PRESENT_POSITION"])
+    for motor_id in motor_ids:
+        sync_read.addParam(motor_id)
+    round_trips = np.empty(n)
+    failures = 0
+    start = time.perf_counter()
+    for i in range(n):
+        t = time.perf_counter()
+        with dnx.lock:
+            comm_result = sync_read.txRxPacket()
+        round_trips[i] = time.perf_counter() - t
+        if comm_result != COMM_SUCCESS or not all(sync_read.isAvailable(motor_id, ADDR["PRESENT_POSITION"], LEN["PRESENT_POSITION"])
+                                                   for motor_id in motor_ids):
+            failures += 1
+    return {"rate": n / (time.perf_counter() - start), "latency_ms": 1000 * round_trips.mean(),
+            "worst_ms": 1000 * round_trips.max(), "failures": failures}
+
+
+# Opens the port and finds the motors, at the configured baud or else by scanning; returns that baud
+def connect(dnx, module, motor_ids):
+    dnx.open_port()
+    if sorted(ping_all(dnx, motor_ids)) == sorted(motor_ids):
+        return module.BAUDRATE
+    for baud, found_ids in scan(dnx).items():
+        if set(motor_ids) <= set(found_ids):
+            print(f"Motors found at {baud} baud, not the configured {module.BAUDRATE}")
+            set_port_baud(dnx, baud)
+            return baud
+    raise IOError(f"Not all of IDs {motor_ids} found at any baud")
+
+
+# Measures the bus at each baud from the slowest up, with the return delay set to delay (1 = 2 us)
+# The sweep stops at the first baud where a motor is lost or a read fails, the fastest baud before it wins
+# With apply the motors stay at that baud and minimal delay and the config BAUDRATE is updated,
+# otherwise the original baud and return delays are restored; torque is left disabled either way
+def tune(dnx, module, motor_ids, bauds=None, n=200, delay=0, apply=False):
+    original_baud = connect(dnx, module, motor_ids)
+    before = measure(dnx, motor_ids, n)
+    with dnx.lock:
+        original_delays = {motor_id: dnx.packet_handler.read1ByteTxRx(dnx.port_handler, motor_id, ADDR["RETURN_DELAY_TIME"])[0]
+                           for motor_id in motor_ids}
+
+    dnx.disable_torques(motor_ids)  # Baud rate and return delay are in the EEPROM area
+    write_byte(dnx, motor_ids, ADDR["RETURN_DELAY_TIME"], delay)
+    results = {}
+    current = original_baud
+    for baud in sorted(bauds or [baud for baud in BAUD_RATES if baud >= 57600]):
+        if baud != current:
+            if not switch_baud(dnx, motor_ids, baud):
+                results[baud] = None
+                print(f"Motors lost at {baud} baud")
+                break
+            current = baud
+        results[baud] = measure(dnx, motor_ids, n)
+        print(f"{baud:>8} baud: {results[baud]['rate']:8.1f} transactions/s, {results[baud]['latency_ms']:.3f} ms round trip, "
+              f"{results[baud]['failures']} failed")
+        if results[baud]["failures"]:
+            break
+
+    reliable = [baud for baud, result in results.items() if result is not None and not result["failures"]]
+    best = max(reliable, key=lambda baud: results[baud]["rate"]) if reliable else original_baud
+    target = best if apply else original_baud
+    if not (current == target or switch_baud(dnx, motor_ids, target)) and not recover(dnx, motor_ids, target):
+        raise IOError(f"Could not bring IDs {motor_ids} back to {target} baud, check them with Dynamixel Wizard")
+    if apply:
+        module.CONFIG.save({**module.CONFIG.load(), "BAUDRATE": best})
+        module.load_config()
+        print(f"IDs {motor_ids} set to {best} baud with return delay {2 * delay} us, {module.CONFIG.path} updated")
+        after = measure(dnx, motor_ids, n)
+    else:
+        for motor_id, original_delay in original_delays.items():
+            dnx._write_data(motor_id, ADDR["RETURN_DELAY_TIME"], original_delay, 1, "return delay time")
+        print(f"IDs {motor_ids} restored, run with --apply to switch to {best} baud")
+        after = results.get(best, before)
+    return before, after, best, results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Find the fastest reliable baud rate and minimal return delay of the motor bus")
+    parser.add_argument("setup", choices=sorted(SETUPS), help="Which config_<setup>.json and driver to use")
+    parser.add_argument("--bauds", type=int, nargs="*", choices=sorted(BAUD_RATES), default=None, help="Bauds to try, default 57600 and up")
+    parser.add_argument("--reads", type=int, default=200, help="Sync reads timed at each baud")
+    parser.add_argument("--delay", type=int, default=0, help="Return delay time to set (1 = 2 us)")
+    parser.add_argument("--apply", action="store_true", help="Keep the best baud on the motors and write it to the config")
+    args = parser.parse_args()
+
+    module, dnx = load_driver(args.setup)
+    motor_ids = list(module.MOTOR_IDS.values())
+    try:
+        before, after, best, _ = tune(dnx, module, motor_ids, args.bauds, args.reads, args.delay, args.apply)
+        print(f"Before: {before['rate']:8.1f} transactions/s, {before['latency_ms']:.3f} ms round trip")
+        print(f"{'After' if args.apply else 'At ' + str(best)}: {after['rate']:8.1f} transactions/s, {after['latency_ms']:.3f} ms round trip")
+    finally:
+        dnx.close_port()
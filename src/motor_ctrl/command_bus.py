@@ -0,0 +1,74 @@
+import threading
+import time
+
+from PyQt5.QtCore import QThread
+
+# Thread-safe mailbox of desired velocities, one slot per motor
+# Input sources (keyboard, gamepad, scripts) post targets; the latest value per motor wins
+class CommandBus:
+
+    def __init__(self):
+        self.targets = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.posted = threading.Event()
+
+    def post(self, motor_id, velocity):
+        with self.lock:
+            self.targets[motor_id] = int(velocity)
+            self.pending[motor_id] = int(velocity)
+        self.posted.set()
+
+    def post_many(self, velocities):
+        with self.lock:
+            for motor_id, velocity in velocities.items():
+                self.targets[motor_id] = int(velocity)
+                self.pending[motor_id] = int(velocity)
+        self.posted.set()
+
+    # Returns the last velocity posted for the motor
+    def target(self, motor_id):
+        with self.lock:
+            return self.targets.get(motor_id, 0)
+
+    # Returns and clears the targets posted since the last call
+    def take(self):
+        with self.lock:
+            pending, self.pending = self.pending, {}
+            self.posted.clear()
+        return pending
+
+
+# Dedicated thread that flushes the coalesced targets of a CommandBus in one batched write
+# A post is sent as soon as the sender is idle, later posts are merged until the next tick
+class CommandSender(QThread):
+
+    def __init__(self, dnx, bus, rate=50):
+        super().__init__()
+        self.dnx = dnx
+        self.bus = bus
+        self.period = 1 / rate
+        self.logger = None  # Optional SessionLogger, every flushed command is logged
+        self.running = True
+
+    def run(self):
+        while self.running:
+            if not self.bus.posted.wait(0.1):
+                continue
+            pending = self.bus.take()
+            if not pending:
+                continue
+            start = time.monotonic()
+            try:
+                self.dnx.set_velocities(pending)
+            except RuntimeError as e:
+                print(f"Command flush failed: {e}")
+            else:
+                if self.logger is not None:
+                    self.logger.log_command(start, pending)
+            delay = self.period - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+    def stop(self):
+        self.running = False
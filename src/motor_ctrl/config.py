@@ -0,0 +1,51 @@
+import json
+import os
+import threading
+
+# Directory of this package, config paths are resolved against it instead of the working directory
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# A JSON config file that is only read when first used and then served from a cache
+# Every load() checks the modification time of the file and parses it again if it changed, so edits
+# are picked up without restarting; schema maps required keys to their types and is checked on each parse
+class ConfigFile:
+
+    def __init__(self, path, schema=None, base=PACKAGE_DIR):
+        self.path = os.path.join(base, path)
+        self.schema = schema or {}
+        self.data = None
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def validate(self, data):
+        if not isinstance(data, dict):
+            raise ValueError(f"{self.path}: expected a JSON object")
+        for key, kind in self.schema.items():
+            if key not in data:
+                raise ValueError(f"{self.path}: missing {key}")
+            if not isinstance(data[key], kind) or isinstance(data[key], bool):
+                raise ValueError(f"{self.path}: {key} must be {getattr(kind, '__name__', kind)}, got {data[key]!r}")
+
+    # Returns the parsed config, read again only if the file changed since the last load
+    def load(self):
+        with self.lock:
+            mtime = os.stat(self.path).st_mtime_ns
+            if self.data is None or mtime != self.mtime:
+                with open(self.path, 'r') as config_file:
+                    data = json.load(config_file)
+                self.validate(data)
+                self.data, self.mtime = data, mtime
+            return self.data
+
+    # Writes data to the file and keeps it as the cached config
+    def save(self, data):
+        self.validate(data)
+        with self.lock:
+            with open(self.path, 'w') as config_file:
+                json.dump(data, config_file, indent=2)
+            self.data, self.mtime = data, os.stat(self.path).st_mtime_ns
+
+    # Forgets the cache, the next load() reads the file
+    def reload(self):
+        with self.lock:
+            self.data = None
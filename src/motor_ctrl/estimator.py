@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+TICKS_PER_MM = 52  # Motor position units per mm of segment travel, 1 mm ~= 52 units
+
+# Process and measurement noise defaults, in mm and s
+ACCEL_NOISE = 50.0  # mm/s^2, how quickly the segment velocity may change
+SLIP_NOISE = 0.5  # mm/sqrt(s), how quickly the drive may slip against the segment
+OPTICAL_NOISE = 0.05  # mm
+MOTOR_NOISE = 0.02  # mm
+
+# Kalman filter for the travel of every segment at once, state per segment is
+# [position (mm), velocity (mm/s), slip (mm)] where slip is motor travel minus segment travel
+# The optical encoder measures position, the motor encoder measures position + slip
+# Measurements are applied whenever they arrive, each stream at its own rate
+class SegmentEstimator:
+
+    def __init__(self, n_segments, ticks_per_mm=TICKS_PER_MM, accel_noise=ACCEL_NOISE, slip_noise=SLIP_NOISE,
+                 optical_noise=OPTICAL_NOISE, motor_noise=MOTOR_NOISE):
+        self.n = n_segments
+        self.ticks_per_mm = ticks_per_mm
+        self.accel_noise = accel_noise
+        self.slip_noise = slip_noise
+        self.optical_noise = optical_noise
+        self.motor_noise = motor_noise
+        self.reset()
+
+    # Forgets the state, the next motor sample becomes the zero of the motor travel
+    def reset(self, t=None):
+        self.t = t
+        self.x = np.zeros((self.n, 3))
+        self.P = np.tile(np.diag([1.0, 100.0, 1.0]), (self.n, 1, 1))
+        self.ticks0 = None
+
+    # Advances every segment to time t (s)
+    def predict(self, t):
+        if self.t is None:
+            self.t = t
+            return
+        dt = t - self.t
+        if dt <= 0:
+            return
+        F = np.array([[1, dt, 0], [0, 1, 0], [0, 0, 1]])
+        q = self.accel_noise ** 2
+        Q = np.array([[q * dt ** 4 / 4, q * dt ** 3 / 2, 0],
+                      [q * dt ** 3 / 2, q * dt ** 2, 0],
+                      [0, 0, self.slip_noise ** 2 * dt]])
+        self.x = self.x @ F.T
+        self.P = F @ self.P @ F.T + Q
+        self.t = t
+
+    # Scalar measurement z = H x + noise for the segments where z is not NaN
+    def _update(self, H, z, r):
+        z = np.asarray(z, dtype=float)
+        valid = ~np.isnan(z)
+        if not valid.any():
+            return
+        x, P = self.x[valid], self.P[valid]
+        PH = P @ H
+        S = PH @ H + r ** 2
+        K = PH / S[:, None]
+        y = z[valid] - x @ H
+        self.x[valid] = x + K * y[:, None]
+        self.P[valid] = P - K[:, :, None] * PH[:, None, :]
+
+    # Optical encoder travel (mm) of every segment at time t, NaN where there is no new sample
+    def update_optical(self, t, travel):
+        self.predict(t)
+        self._update(np.array([1.0, 0.0, 0.0]), travel, self.optical_noise)
+
+    # Motor PRESENT_POSITION (ticks) of every segment at time t, NaN where there is no new sample
+    def update_motor(self, t, ticks):
+        ticks = np.asarray(ticks, dtype=float)
+        if self.ticks0 is None:
+            self.ticks0 = ticks.copy()
+        self.ticks0 = np.where(np.isnan(self.ticks0), ticks, self.ticks0)  # Motors seen for the first time
+        self.predict(t)
+        self._update(np.array([1.0, 0.0, 1.0]), (ticks - self.ticks0) / self.ticks_per_mm, self.motor_noise)
+
+    # Returns the position (mm), velocity (mm/s) and slip (mm) arrays, predicted to t if given
+    def estimate(self, t=None):
+        if t is not None and self.t is not None and t > self.t:
+            dt = t - self.t
+            return self.x[:, 0] + self.x[:, 1] * dt, self.x[:, 1].copy(), self.x[:, 2].copy()
+        return self.x[:, 0].copy(), self.x[:, 1].copy(), self.x[:, 2].copy()
+
+
+# Runs the estimator over recorded streams and returns estimates on a fixed-rate time grid
+# optical_t (n,), optical (n, n_segments) in mm, motor_t (m,), motor (m, n_segments) in ticks
+# Returns t, position, velocity, slip, each with one row per output sample
+def estimate_log(optical_t, optical, motor_t, motor, rate=100, estimator=None):
+    optical, motor = np.asarray(optical, dtype=float), np.asarray(motor, dtype=float)
+    estimator = estimator or SegmentEstimator(optical.shape[1] if optical.size else motor.shape[1])
+    events = [(t, 0, i) for i, t in enumerate(optical_t)] + [(t, 1, i) for i, t in enumerate(motor_t)]
+    events.sort()
+    start = min(event[0] for event in events)
+    grid = np.arange(start, max(event[0] for event in events) + 1e-9, 1 / rate)
+    out = np.empty((3, len(grid), estimator.n))
+    k = 0
+    for t, stream, i in events:
+        while k < len(grid) and grid[k] < t:
+            out[:, k] = estimator.estimate(grid[k])
+            k += 1
+        if stream == 0:
+            estimator.update_optical(t, optical[i])
+        else:
+            estimator.update_motor(t, motor[i])
+    for k in range(k, len(grid)):
+        out[:, k] = estimator.estimate(grid[k])
+    return grid, out[0], out[1], out[2]
+
+
+# Live estimator fed by the optical readers of an Optical4 and the snapshots of a TelemetryThread
+# Motor samples are taken from the telemetry snapshots, so no extra bus traffic is generated; optical
+# samples are collected by a listener on each reader as they arrive, so every new snapshot and every
+# optical sample is applied once, in time order, and estimates are emitted at rate
+class EstimatorThread(QThread):
+
+    updated = pyqtSignal(dict)
+
+    def __init__(self, motor_ids, optical_readers, telemetry, rate=100, estimator=None):
+        super().__init__()
+        self.motor_ids = list(motor_ids)
+        self.optical_readers = list(optical_readers)  # One SerialReader (or None) per motor
+        self.telemetry = telemetry
+        self.period = 1 / rate
+        self.estimator = estimator or SegmentEstimator(len(self.motor_ids))
+        self.estimate = {}
+        self.optical_samples = deque()  # (time, segment index, travel) since the last tick
+        self.listeners = {}  # {segment index: listener on its reader} while running
+        self.running = True
+        self.lock = threading.Lock()
+
+    # Returns the latest estimate: {"time": t, "position"|"velocity"|"slip": {motor_id: value}}
+    def latest(self):
+        with self.lock:
+            return self.estimate
+
+    # Returns the optical samples received since the last call as (time, 0, travel of every segment),
+    # NaN for the segments the sample is not from
+    def take_optical(self):
+        samples = []
+        while self.optical_samples:
+            t, i, y = self.optical_samples.popleft()
+            travel = np.full(len(self.motor_ids), np.nan)
+            travel[i] = y
+            samples.append((t, 0, travel))
+        return samples
+
+    def run(self):
+        for i, reader in enumerate(self.optical_readers):
+            if reader is not None:
+                self.listeners[i] = lambda t, dx, dy, x, y, i=i: self.optical_samples.append((t, i, y))
+                reader.listeners.append(self.listeners[i])
+        last_snapshot = None
+        next_tick = time.monotonic()
+        while self.running:
+            events = self.take_optical()
+            snapshot = self.telemetry.latest()
+            if snapshot and snapshot is not last_snapshot and "position" in snapshot:
+                ticks = [snapshot["position"].get(motor_id, np.nan) for motor_id in self.motor_ids]
+                events.append((snapshot["time"], 1, ticks))
+                last_snapshot = snapshot
+            for t, stream, values in sorted(events, key=lambda event: event[:2]):
+                if stream == 0:
+                    self.estimator.update_optical(t, values)
+                else:
+                    self.estimator.update_motor(t, values)
+            now = time.monotonic()
+
+            position, velocity, slip = self.estimator.estimate(now)
+            estimate = {"time": now}
+            for name, values in [("position", position), ("velocity", velocity), ("slip", slip)]:
+                estimate[name] = dict(zip(self.motor_ids, values.tolist()))
+            with self.lock:
+                self.estimate = estimate
+            self.updated.emit(estimate)
+
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()
+        for i, listener in self.listeners.items():
+            self.optical_readers[i].listeners.remove(listener)
+        self.listeners = {}
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,173 @@
+import time
+
+try:
+    from motor_ctrl.motion_profile import arrival_times
+    from motor_ctrl.bus_scheduler import priority, MOTION
+except ImportError:  # Run as a script from src/motor_ctrl
+    from motion_profile import arrival_times
+    from bus_scheduler import priority, MOTION
+
+POLL_INTERVAL = 0.02  # s between moving status reads while waiting for arrivals
+
+
+# One step of a compiled gait: move the given motors to absolute positions at vel,
+# once every motor listed in after has arrived
+class GaitAction:
+
+    def __init__(self, name, targets, vel, after, duration):
+        self.name = name
+        self.targets = targets
+        self.vel = vel
+        self.after = after
+        self.duration = duration  # Predicted time to arrival (s)
+
+    def __repr__(self):
+        return f"GaitAction({self.name!r}, {self.targets}, vel={self.vel}, after={sorted(self.after)})"
+
+
+# Compiles a declarative gait into an ordered list of GaitActions
+# gait: list of phases {"clamp": {clamp_id: desc}, "extend": [[segment_id, ...], ...]}, each group in
+#   "extend" is pushed out by extension ticks from home and pulled back before the next group moves
+# home: {segment_id: position}, clamp_pos: {clamp_id: {desc: position}}
+# A clamp changes state only once every motor in flight has arrived, like moving_1or3/moving_2or4
+# A phase may list clamps under "overlap": those only wait for their own segments and themselves, so
+#   they can change while other segments are still moving; only opt in where that is known to be safe
+# clamp_segments: {clamp_id: [segment_id, ...]} segments a clamp holds, only used by "overlap"
+# Clamp transitions to the state a clamp is already in are dropped
+# acc is the PROFILE_ACCELERATION of the motors, used for the predicted durations
+def compile_gait(gait, home, clamp_pos, clamp_segments, extension, vel, clamp_vel=1500, clamp_state=None, acc=0):
+    clamp_segments = clamp_segments or {}
+    position = dict(home)
+    state = dict(clamp_state or {})
+    moving = set()  # Motors whose last action has not been waited for yet
+    actions = []
+    for phase in gait:
+        clamp_actions = []
+        for clamp_id, desc in phase.get("clamp", {}).items():
+            if state.get(clamp_id) == desc:
+                continue
+            target = clamp_pos[clamp_id][desc]
+            prev = clamp_pos[clamp_id].get(state.get(clamp_id), target)
+            action_vel = 2000 if desc in ["home", "rest"] else clamp_vel
+            if clamp_id in phase.get("overlap", []):
+                if clamp_id not in clamp_segments:
+                    raise ValueError(f"Clamp {clamp_id} overlaps moves but holds no segments in clamp_segments")
+                after = moving & (set(clamp_segments[clamp_id]) | {clamp_id})
+            else:
+                after = set(moving)
+            clamp_actions.append(GaitAction(f"clamp {clamp_id} {desc}", {clamp_id: target}, action_vel, after,
+                                            float(arrival_times(target - prev, action_vel, acc))))
+            state[clamp_id] = desc
+        # Actions start in order, so clamps that overlap the last move go first
+        clamp_actions.sort(key=lambda action: len(action.after))
+        for action in clamp_actions:
+            actions.append(action)
+            moving |= set(action.targets)
+
+        for group in phase.get("extend", []):
+            for offset, verb in [(phase.get("extension", extension), "extend"), (0, "retract")]:
+                targets = {segment_id: home[segment_id] + offset for segment_id in group}
+                duration = float(arrival_times([targets[i] - position[i] for i in group], vel, acc).max())
+                actions.append(GaitAction(f"{verb} {group}", targets, vel, set(moving), duration))
+                position.update(targets)
+                moving = set(group)
+    return actions
+
+
+# Predicted cycle time (s) of a schedule: each action starts when the motors it waits for have arrived
+def predict_cycle(actions):
+    ready = {}
+    start = 0
+    for action in actions:
+        start = max([start] + [ready.get(motor_id, 0) for motor_id in action.after])
+        for motor_id in action.targets:
+            ready[motor_id] = start + action.duration
+    return max(ready.values(), default=0)
+
+
+# Runs a schedule on a Dynamixel driver, waiting on arrivals instead of fixed sleeps
+# Actions start in order; the moving status of every motor in flight is read in one group read per poll
+# Returns (predicted, actual) cycle time in seconds
+def run_gait(dnx, actions, poll_interval=POLL_INTERVAL, mode="extpos"):
+    predicted = predict_cycle(actions)
+    started = {}  # Motors in flight and when they were sent off
+    start = time.monotonic()
+    for action in actions:
+        while started.keys() & action.after:
+            time.sleep(poll_interval)
+            _poll_arrivals(dnx, started, poll_interval)
+        dnx.set_modes({motor_id: mode for motor_id in action.targets})
+        for motor_id in action.targets:
+            dnx.set_profile_velocity(motor_id, action.vel)
+        dnx.set_positions(action.targets, mode)
+        for motor_id in action.targets:
+            started[motor_id] = time.monotonic()
+    while started:
+        time.sleep(poll_interval)
+        _poll_arrivals(dnx, started, poll_interval)
+    actual = time.monotonic() - start
+    print(f"Gait cycle: predicted {predicted:.2f} s, actual {actual:.2f} s")
+    return predicted, actual
+
+
+# Removes the motors that report in-position from started
+# A motor sent off less than one poll ago may not have cleared its in-position flag yet, so it is skipped
+def _poll_arrivals(dnx, started, poll_interval):
+    now = time.monotonic()
+    with priority(MOTION):
+        statuses = dnx.get_moving_statuses(list(started))
+    for motor_id, status in statuses.items():
+        if status & 0b01 and now - started[motor_id] >= poll_interval:
+            del started[motor_id]
+
+
+#### Main ####
+
+if __name__ == "__main__":
+    from sync_clamp import Dynamixel6, MOTOR_IDS, MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID, MOTOR5_ID, MOTOR6_ID
+
+    EXTEN = 1000
+    EXVEL = 33
+
+    # Clamp-and-extend insertion, same sequence as the sync_clamp demo
+    INSERTION_GAIT = [
+        {"clamp": {MOTOR5_ID: "heavy", MOTOR6_ID: "light"}, "extend": [[MOTOR1_ID], [MOTOR3_ID]]},
+        {"clamp": {MOTOR5_ID: "light", MOTOR6_ID: "heavy"}, "extend": [[MOTOR4_ID], [MOTOR2_ID]]},
+        {"clamp": {MOTOR5_ID: "medium", MOTOR6_ID: "medium"}, "extend": [[MOTOR3_ID, MOTOR4_ID], [MOTOR1_ID, MOTOR2_ID],
+                                                                         [MOTOR1_ID, MOTOR4_ID], [MOTOR2_ID, MOTOR3_ID]]},
+        {"clamp": {MOTOR5_ID: "medium", MOTOR6_ID: "medium"}, "extend": [[MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID]]}
+    ]
+    # Which segments each clamp holds is an assumption: moving_1or3 sets clamp 1 (MOTOR5) heavy and clamp 2
+    # (MOTOR6) light to move segments 1 and 3, and this pairing follows it; it is not checked on the
+    # hardware, so the gait above does not opt in to "overlap" and every clamp change waits for all segments
+    CLAMP_SEGMENTS = {MOTOR5_ID: [MOTOR1_ID, MOTOR3_ID], MOTOR6_ID: [MOTOR2_ID, MOTOR4_ID]}
+
+    dnx = Dynamixel6()
+    try:
+        dnx.open_port()
+        dnx.enable_torques(MOTOR_IDS.values())
+
+        dnx.define_quadpos0()
+        dnx.define_homeclamp1()
+        dnx.define_homeclamp2()
+        dnx.goto_clamp_rest()
+
+        home = {motor_id: dnx.motor_pos0[motor_id] for motor_id in [MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID]}
+        clamp_pos = {
+            MOTOR5_ID: {desc: dnx.clamp1_pos0 + pos for desc, pos in dnx.clamp1_pos.items()},
+            MOTOR6_ID: {desc: dnx.clamp2_pos0 + pos for desc, pos in dnx.clamp2_pos.items()}
+        }
+        actions = compile_gait(INSERTION_GAIT, home, clamp_pos, CLAMP_SEGMENTS, EXTEN, EXVEL,
+                               clamp_state={MOTOR5_ID: "rest", MOTOR6_ID: "rest"}, acc=dnx.get_profile_acceleration(MOTOR1_ID))
+        for action in actions:
+            print(action)
+
+        response = input("Press enter to start")
+        if response == "":
+            run_gait(dnx, actions)
+
+        dnx.goto_clamp_home()
+
+    finally:
+        dnx.disable_torques(MOTOR_IDS.values())
+        dnx.close_port()
@@ -0,0 +1,118 @@
+import functools
+import threading
+import time
+
+import numpy as np
+from inputs import devices, get_gamepad
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Stick axes in the order they are mapped to motors, inputs reports them as signed 16-bit
+GAMEPAD_AXES = ["ABS_Y", "ABS_RY", "ABS_X", "ABS_RX"]
+AXIS_RANGE = 32768
+
+
+# Whether a gamepad is connected, looked up once per process in the device list of inputs
+# (calling get_gamepad() to find out blocks until the gamepad sends an event)
+@functools.lru_cache(maxsize=None)
+def gamepad_connected():
+    if not devices.gamepads:
+        print("No gamepad found")
+        return False
+    return True
+
+
+# Reads gamepad events at the device rate and keeps the latest raw state of every axis
+# Button presses are emitted as a signal so widgets are only touched from the GUI thread
+class GamepadReader(QThread):
+
+    button_pressed = pyqtSignal(str)
+
+    def __init__(self, axes=GAMEPAD_AXES):
+        super().__init__()
+        self.axis_index = {code: i for i, code in enumerate(axes)}
+        self.axes = np.zeros(len(axes))
+        self.running = True
+        self.lock = threading.Lock()
+
+    def run(self):
+        while self.running:
+            try:
+                events = get_gamepad()
+            except Exception as e:
+                print(f"Gamepad lost: {e}")
+                break
+            with self.lock:
+                for event in events:
+                    if event.code in self.axis_index:
+                        self.axes[self.axis_index[event.code]] = event.state
+            for event in events:
+                if event.code.startswith("BTN_") and event.state == 1:
+                    self.button_pressed.emit(event.code)
+        with self.lock:
+            self.axes[:] = 0  # Never leave the last stick deflection latched
+
+    # Returns a copy of the raw axis values
+    def read(self):
+        with self.lock:
+            return self.axes.copy()
+
+    def stop(self):
+        self.running = False
+
+
+# Vectorised deadband, expo and slew-rate shaping of all axes at once
+# deadband and expo are fractions of full stick, slew is in velocity units per second (None = unlimited)
+class GamepadShaper:
+
+    def __init__(self, n_axes, max_vel, deadband=0.15, expo=0.0, slew=None):
+        self.max_vel = np.broadcast_to(np.asarray(max_vel, dtype=float), (n_axes,))
+        self.deadband = np.broadcast_to(np.asarray(deadband, dtype=float), (n_axes,))
+        self.expo = np.broadcast_to(np.asarray(expo, dtype=float), (n_axes,))
+        self.slew = None if slew is None else np.broadcast_to(np.asarray(slew, dtype=float), (n_axes,))
+        self.output = np.zeros(n_axes)
+
+    def shape(self, raw, dt):
+        x = np.clip(np.asarray(raw, dtype=float) / AXIS_RANGE, -1, 1)
+        # Deadband is rescaled so the output starts from 0 at its edge instead of jumping
+        mag = np.clip((np.abs(x) - self.deadband) / (1 - self.deadband), 0, 1)
+        mag = (1 - self.expo) * mag + self.expo * mag ** 3
+        target = np.sign(x) * mag * self.max_vel
+        if self.slew is None:
+            self.output = target
+        else:
+            step = self.slew * dt
+            self.output = self.output + np.clip(target - self.output, -step, step)
+        return np.rint(self.output).astype(int)
+
+    def reset(self):
+        self.output[:] = 0
+
+
+# Samples the reader at a fixed rate, shapes the axes and streams the result to a CommandBus
+# Only velocities that changed since the last tick are posted
+class GamepadStreamer(QThread):
+
+    def __init__(self, reader, bus, motor_ids, rate=200, max_vel=65, deadband=0.15, expo=0.0, slew=None):
+        super().__init__()
+        self.reader = reader
+        self.bus = bus
+        self.motor_ids = list(motor_ids)
+        self.period = 1 / rate
+        self.shaper = GamepadShaper(len(self.motor_ids), max_vel, deadband, expo, slew)
+        self.running = True
+
+    def run(self):
+        last = np.zeros(len(self.motor_ids), dtype=int)
+        last_tick = time.monotonic()
+        while self.running:
+            time.sleep(self.period)
+            now = time.monotonic()
+            output = self.shaper.shape(self.reader.read()[:len(self.motor_ids)], now - last_tick)
+            last_tick = now
+            changed = np.flatnonzero(output != last)
+            if changed.size:
+                self.bus.post_many({self.motor_ids[i]: output[i] for i in changed})
+                last = output
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,329 @@
+import argparse
+import pickle
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+
+from PyQt5.QtCore import QCoreApplication, QTimer
+try:
+    from motor_ctrl.bus_scheduler import priority, ESTOP
+    from motor_ctrl.bus_tune import SETUPS, load_setup
+    from motor_ctrl.command_bus import CommandBus, CommandSender
+    from motor_ctrl.multi_port import multi_port
+    from motor_ctrl.state_bus import STATE_NAME, STATE_RATE, StatePublisher, StateReader, StateWriter, open_optical
+except ImportError:  # Run as a script from src/motor_ctrl
+    from bus_scheduler import priority, ESTOP
+    from bus_tune import SETUPS, load_setup
+    from command_bus import CommandBus, CommandSender
+    from multi_port import multi_port
+    from state_bus import STATE_NAME, STATE_RATE, StatePublisher, StateReader, StateWriter, open_optical
+
+DAEMON_ADDRESS = ("127.0.0.1", 8766)
+DAEMON_AUTHKEY = b"pbn-control"  # Only keeps stray connections out, the daemon listens on localhost
+HEARTBEAT_INTERVAL = 0.1  # s between client heartbeats
+HEARTBEAT_TIMEOUT = 0.5  # s of silence after which the velocities of a client are zeroed
+COMMAND_RATE = 50  # Hz, max rate of batched velocity writes
+LOCAL_METHODS = ["open_port", "close_port"]  # The daemon owns the ports, clients cannot open or close them
+CACHE_AGE = 1.0  # s a client keeps driver attribute values (e.g. clamp1_pos) between calls that could change them
+ERRORS = {"RuntimeError": RuntimeError, "OSError": IOError, "ValueError": ValueError}
+
+
+# Process that owns the motor bus (and optical encoders) and keeps running whatever its clients do
+# The state is polled into a shared memory block (see state_bus), driver calls come over a local
+# multiprocessing connection, one thread per connection; velocities go through a CommandBus like in the GUIs
+# Watchdog: a connection that sends nothing for timeout, or is gone, has the motors it set moving zeroed
+class IODaemon:
+
+    def __init__(self, dnx, motor_ids, readers=(), address=DAEMON_ADDRESS, authkey=DAEMON_AUTHKEY,
+                 state_name=STATE_NAME, rate=STATE_RATE, timeout=HEARTBEAT_TIMEOUT):
+        self.dnx = dnx
+        self.motor_ids = list(motor_ids)
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.writer = StateWriter(self.motor_ids, n_optical=len(readers), name=state_name)
+        self.publisher = StatePublisher(dnx, self.motor_ids, self.writer, readers, rate)
+        self.bus = CommandBus()
+        self.command_sender = CommandSender(dnx, self.bus, rate=COMMAND_RATE)
+        self.clients = {}  # {client number: {"seen": last message time, "armed": IDs it has moving}}
+        self.lock = threading.Lock()
+        self.listener = None
+        self.running = True
+
+    # Zeroes the motors the client has moving; posted first so the sender cannot flush an older velocity after
+    def _stop_client(self, number, reason):
+        with self.lock:
+            client = self.clients.get(number)
+            armed = client["armed"] if client else set()
+            if client:
+                client["armed"] = set()
+        if not armed:
+            return
+        zeros = {motor_id: 0 for motor_id in armed}
+        self.bus.post_many(zeros)
+        try:
+            with priority(ESTOP):
+                self.dnx.set_velocities(zeros)
+        except RuntimeError as e:
+            print(f"Watchdog stop failed: {e}")
+        print(f"Client {number} {reason}, IDs {sorted(armed)} stopped")
+
+    def _watchdog(self):
+        while self.running:
+            now = time.monotonic()
+            with self.lock:
+                silent = [number for number, client in self.clients.items()
+                          if client["armed"] and now - client["seen"] > self.timeout]
+            for number in silent:
+                self._stop_client(number, f"silent for more than {self.timeout} s")
+            time.sleep(self.timeout / 5)
+
+    # Any message counts as a heartbeat, see _serve_client
+    def _handle(self, number, kind, args):
+        if kind == "heartbeat":
+            return None
+        if kind == "velocities":
+            velocities, = args
+            if not set(velocities) <= set(self.motor_ids):
+                raise ValueError(f"Unknown IDs {sorted(set(velocities) - set(self.motor_ids))}")
+            with self.lock:
+                armed = self.clients[number]["armed"]
+                armed |= {motor_id for motor_id, velocity in velocities.items() if velocity}
+                armed -= {motor_id for motor_id, velocity in velocities.items() if not velocity}
+            self.bus.post_many(velocities)
+            return None
+        name = args[0]
+        if name.startswith("_") or name in LOCAL_METHODS or not hasattr(self.dnx, name):
+            raise AttributeError(f"Driver has no attribute {name!r} available to clients")
+        value = getattr(self.dnx, name)
+        if kind == "attr":
+            return ("method", None) if callable(value) else ("value", value)
+        if kind == "call":
+            return value(*args[1], **args[2])
+        raise ValueError(f"Unknown request {kind!r}")
+
+    def _serve_client(self, conn, number):
+        print(f"Client {number} connected")
+        try:
+            while self.running:
+                kind, args = conn.recv()
+                with self.lock:
+                    self.clients[number]["seen"] = time.monotonic()
+                try:
+                    result = ("ok", self._handle(number, kind, args))
+                except Exception as e:  # Reported to the client, the daemon keeps serving
+                    result = ("error", type(e).__name__, str(e))
+                try:
+                    conn.send(result)
+                except (pickle.PicklingError, TypeError, AttributeError):  # e.g. the Event of a timed move
+                    conn.send(("ok", None))
+        except (EOFError, OSError):
+            pass
+        finally:
+            self._stop_client(number, "disconnected")
+            with self.lock:
+                del self.clients[number]
+            conn.close()
+            print(f"Client {number} closed")
+
+    # Runs until stop() or Ctrl+C, the port must be open
+    def serve_forever(self):
+        self.publisher.start()
+        self.command_sender.start()
+        threading.Thread(target=self._watchdog, daemon=True).start()
+        self.listener = Listener(self.address, authkey=self.authkey)
+        print(f"I/O daemon listening on {self.address[0]}:{self.address[1]}, state in {self.writer.shm.name}")
+        number = 0
+        try:
+            while self.running:
+                try:
+                    conn = self.listener.accept()
+                except (OSError, AuthenticationError):  # Closed by stop(), or a client with the wrong key
+                    continue
+                number += 1
+                with self.lock:
+                    self.clients[number] = {"seen": time.monotonic(), "armed": set()}
+                threading.Thread(target=self._serve_client, args=(conn, number), daemon=True).start()
+        finally:
+            self.shutdown()
+
+    def stop(self):
+        self.running = False
+        if self.listener is not None:
+            self.listener.close()
+
+    # Stops every motor in velocity mode, then the threads; torque and the port are left to the caller
+    def shutdown(self):
+        self.running = False
+        for number in list(self.clients):
+            self._stop_client(number, "dropped by shutdown")
+        moving = {motor_id: 0 for motor_id in self.motor_ids if self.dnx.motor_modes.get(motor_id) == "vel"}
+        if moving:
+            with priority(ESTOP):
+                self.dnx.set_velocities(moving)
+        self.command_sender.stop()
+        self.command_sender.wait()
+        self.publisher.stop()
+        self.publisher.wait()
+        self.writer.close()
+
+
+# Stands in for the Dynamixel* classes in a client process of an IODaemon
+# Group reads come from the daemon's shared memory state, velocities go to its CommandBus and any other
+# method or attribute of the driver is forwarded over the connection
+# Heartbeats and velocities have a connection of their own, so a forwarded call that blocks (a move
+# waiting for arrival, a bring-up step) never holds them up and gets the client's motors zeroed
+# Heartbeats are sent from the Qt event loop when there is one, so a frozen GUI stops the motors,
+# otherwise from a background thread
+# Attribute values are kept for CACHE_AGE, or until a call other than a get_* could have changed them
+class DaemonDynamixel:
+
+    def __init__(self, address=DAEMON_ADDRESS, authkey=DAEMON_AUTHKEY, state_name=STATE_NAME, heartbeat=HEARTBEAT_INTERVAL):
+        self.methods = set()  # Names known to be driver methods
+        self.values = {}  # {name: (time, value)} of driver attributes
+        self.conn = Client(address, authkey=authkey)
+        self.request_lock = threading.Lock()  # One request at a time on each connection
+        self.control = Client(address, authkey=authkey)  # Heartbeats and velocities
+        self.control_lock = threading.Lock()
+        self.state = StateReader(state_name)
+        self.motor_ids = self.state.motor_ids
+        self.connected = True
+        self.timer = None
+        if QCoreApplication.instance() is not None:
+            self.timer = QTimer()
+            self.timer.timeout.connect(self.heartbeat)
+            self.timer.start(int(heartbeat * 1000))
+        else:
+            threading.Thread(target=self._heartbeat_loop, args=(heartbeat,), daemon=True).start()
+
+    def _exchange(self, conn, lock, kind, args):
+        with lock:
+            conn.send((kind, args))
+            status, *result = conn.recv()
+        if status == "error":
+            name, message = result
+            if name == "AttributeError":
+                raise AttributeError(message)
+            raise ERRORS.get(name, RuntimeError)(message)
+        return result[0]
+
+    def _request(self, kind, *args):
+        return self._exchange(self.conn, self.request_lock, kind, args)
+
+    # On the heartbeat connection
+    def _command(self, kind, *args):
+        return self._exchange(self.control, self.control_lock, kind, args)
+
+    def _heartbeat_loop(self, interval):
+        while self.connected:
+            self.heartbeat()
+            time.sleep(interval)
+
+    def heartbeat(self):
+        if self.connected:
+            try:
+                self._command("heartbeat")
+            except (EOFError, OSError):
+                self.connected = False
+                print("I/O daemon connection lost")
+
+    def _call(self, name, args, kwargs):
+        try:
+            return self._request("call", name, args, kwargs)
+        finally:
+            if not name.startswith("get_"):
+                self.values.clear()
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        if name in self.methods:
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+        cached = self.values.get(name)
+        if cached is not None and time.monotonic() - cached[0] < CACHE_AGE:
+            return cached[1]
+        kind, value = self._request("attr", name)
+        if kind == "method":
+            self.methods.add(name)
+            return lambda *args, **kwargs: self._call(name, args, kwargs)
+        self.values[name] = (time.monotonic(), value)
+        return value
+
+    def _read_state(self, field, motor_ids, partial):
+        try:
+            values = self.state.read().get(field, {})
+        except TimeoutError as e:  # Daemon died writing the state, fail like a bus read
+            raise RuntimeError(str(e))
+        motor_ids = self.motor_ids if motor_ids is None else motor_ids
+        missing = [motor_id for motor_id in motor_ids if motor_id not in values]
+        if missing and not partial:
+            raise RuntimeError(f"No {field} of IDs {missing} in the daemon state")
+        return {motor_id: values[motor_id] for motor_id in motor_ids if motor_id in values}
+
+    def get_positions(self, motor_ids=None, partial=False):
+        return self._read_state("position", motor_ids, partial)
+
+    def get_velocities(self, motor_ids=None, partial=False):
+        return self._read_state("velocity", motor_ids, partial)
+
+    def get_currents(self, motor_ids=None, partial=False):
+        return self._read_state("current", motor_ids, partial)
+
+    def get_voltages(self, motor_ids=None, partial=False):
+        return self._read_state("voltage", motor_ids, partial)
+
+    def get_temperatures(self, motor_ids=None, partial=False):
+        return self._read_state("temperature", motor_ids, partial)
+
+    def set_velocities(self, velocities):
+        self._command("velocities", dict(velocities))
+
+    def set_velocity(self, motor_id, velocity):
+        self.set_velocities({motor_id: velocity})
+
+    # Polled by TelemetryThread, a lost daemon fails like a bus read
+    def get_faults(self):
+        try:
+            return self._request("call", "get_faults", (), {})
+        except (EOFError, OSError) as e:
+            raise RuntimeError(f"I/O daemon connection lost: {e}")
+
+    def open_port(self):
+        print(f"Using the I/O daemon for IDs {self.motor_ids}")
+
+    # Ends the session, the daemon zeroes the velocities this client left running
+    def close_port(self):
+        self.connected = False
+        if self.timer is not None:
+            self.timer.stop()
+        with self.control_lock:
+            self.control.close()
+        with self.request_lock:
+            self.conn.close()
+        self.state.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Own the motor bus (and optical encoders) in a process of its own for the GUIs and scripts")
+    parser.add_argument("setup", choices=sorted(SETUPS), help="Which config_<setup>.json and driver to use")
+    parser.add_argument("--optical", action="store_true", help="Also publish the travel of the optical encoders")
+    parser.add_argument("--rate", type=float, default=STATE_RATE, help="State polls per second")
+    parser.add_argument("--timeout", type=float, default=HEARTBEAT_TIMEOUT, help="Heartbeat timeout (s) of the clients")
+    args = parser.parse_args()
+
+    module, driver_class = load_setup(args.setup)
+    motor_ids = list(module.MOTOR_IDS.values())
+    dnx = multi_port(driver_class)
+    dnx.open_port()
+    optical, readers = open_optical() if args.optical else (None, [])
+    daemon = IODaemon(dnx, motor_ids, readers, rate=args.rate, timeout=args.timeout)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if optical is not None:
+            optical.close()
+        dnx.disable_torques(motor_ids)
+        dnx.close_port()
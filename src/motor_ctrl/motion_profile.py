@@ -0,0 +1,67 @@
+import numpy as np
+
+# Control table units of the velocity-based profile (Drive Mode bit 2 = 0)
+VELOCITY_UNIT = 0.229  # rev/min per PROFILE_VELOCITY unit
+ACCELERATION_UNIT = 214.577  # rev/min^2 per PROFILE_ACCELERATION unit
+TICKS_PER_REV = 4096
+
+# Converts profile velocity units to ticks/s
+def velocity_ticks(vel):
+    return np.asarray(vel, dtype=float) * VELOCITY_UNIT * TICKS_PER_REV / 60
+
+# Converts profile acceleration units to ticks/s^2
+def acceleration_ticks(acc):
+    return np.asarray(acc, dtype=float) * ACCELERATION_UNIT * TICKS_PER_REV / 3600
+
+
+# Time (s) for each motor to cover its distance (ticks) with a trapezoidal profile
+# All arguments broadcast, so one call covers every motor of a move
+# acc = 0 means no ramp (constant velocity), vel = 0 means no limit and is predicted as immediate
+def arrival_times(distance, vel, acc):
+    d = np.abs(np.asarray(distance, dtype=float))
+    v = velocity_ticks(vel)
+    a = acceleration_ticks(acc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cruise = d / v + v / a  # Reaches vel, ramp time v/a at each end
+        triangle = 2 * np.sqrt(d / a)  # Too short to reach vel
+        t = np.where(d >= v * v / a, cruise, triangle)
+        t = np.where(a == 0, d / v, t)
+    return np.where((v == 0) | (d == 0), 0.0, t)
+
+
+# Position along each profile at time t (s) after the start, as an offset from the start position
+# t has shape (n,), the result has shape (n, n_motors)
+def profile_positions(t, distance, vel, acc):
+    t = np.asarray(t, dtype=float)[:, None]
+    d = np.asarray(distance, dtype=float)
+    sign = np.sign(d)
+    d = np.abs(d)
+    total = arrival_times(d, vel, acc)
+    a = acceleration_ticks(acc) * np.ones_like(d)
+    # Peak velocity actually reached, lower than vel on a triangular profile
+    peak = np.where(a == 0, velocity_ticks(vel) * np.ones_like(d), np.minimum(velocity_ticks(vel), a * total / 2))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ramp = np.where(a == 0, 0.0, peak / a)
+    t = np.clip(t, 0, total)
+    up = 0.5 * a * np.minimum(t, ramp) ** 2
+    flat = peak * np.clip(t - ramp, 0, np.maximum(total - 2 * ramp, 0))
+    down_t = np.clip(t - (total - ramp), 0, ramp)
+    down = peak * down_t - 0.5 * a * down_t ** 2
+    return sign * np.minimum(up + flat + down, d)
+
+
+# Per-motor profile velocities so every motor arrives together with the slowest one at vel
+# Solves d / v + v / a = T for v (slower root), or v = d / T without ramps; never exceeds vel
+def synchronised_velocities(distance, vel, acc):
+    d = np.abs(np.asarray(distance, dtype=float))
+    vel = np.asarray(vel, dtype=float) * np.ones_like(d)
+    acc = np.asarray(acc, dtype=float) * np.ones_like(d)
+    total = arrival_times(d, vel, acc).max(initial=0)
+    if total == 0:
+        return np.rint(vel).astype(int)
+    a = acceleration_ticks(acc)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        v = (a * total - np.sqrt(np.maximum((a * total) ** 2 - 4 * a * d, 0))) / 2
+        v = np.where(a == 0, d / total, v)
+    units = np.ceil(v / velocity_ticks(1))  # Rounded up so no motor finishes late
+    return np.clip(units, 1, vel).astype(int)
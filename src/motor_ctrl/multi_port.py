@@ -0,0 +1,164 @@
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from dynamixel_sdk import GroupSyncRead
+try:
+    from motor_ctrl.bus_scheduler import current_priority, priority
+except ImportError:  # Run as a script from src/motor_ctrl
+    from bus_scheduler import current_priority, priority
+
+PORT_WORKERS = 4  # I/O threads per port, the port's BusScheduler orders their packets
+
+
+# Mixin for a Dynamixel* class whose motors are spread over several ports (e.g. one U2D2 for the
+# segment drives, one for the clamps); build it with multi_port()
+# The driver keeps all its state and higher-level methods, only the methods that put packets on the
+# bus are replaced: each port has its own driver (shard) with its own port, lock and sync handlers,
+# single-motor packets go straight to the shard of the motor, and group reads and writes are split
+# by port, sent on the port workers in parallel and joined, so the buses run side by side
+class MultiPortDriver:
+
+    driver_class = None  # Set by multi_port()
+
+    # ports: {devicename: [motor_id]}, every motor on exactly one port
+    def __init__(self, ports):
+        super().__init__()
+        self.shards = {devicename: self.driver_class(devicename) for devicename in ports}
+        self.ports = {motor_id: devicename for devicename, motor_ids in ports.items() for motor_id in motor_ids}
+        self.workers = {devicename: ThreadPoolExecutor(PORT_WORKERS, thread_name_prefix=f"port-{devicename}") for devicename in ports}
+        # Names of the group read handlers, a group read on the driver uses the same handler of each shard
+        self.sync_read_names = {id(value): name for name, value in vars(self).items() if isinstance(value, GroupSyncRead)}
+
+    def _shard(self, motor_id):
+        if motor_id not in self.ports:
+            raise ValueError(f"ID {motor_id} is not on any port")
+        return self.shards[self.ports[motor_id]]
+
+    # Splits motor IDs, or a {motor_id: value} dict, into {devicename: part} in the same form
+    def _split(self, motors):
+        parts = {}
+        for motor_id in motors:
+            self._shard(motor_id)
+            part = parts.setdefault(self.ports[motor_id], {} if isinstance(motors, dict) else [])
+            if isinstance(motors, dict):
+                part[motor_id] = motors[motor_id]
+            else:
+                part.append(motor_id)
+        return parts
+
+    # Runs call(shard, part) for each port with motors on the port workers, in the caller's traffic class
+    # Returns {devicename: result or the RuntimeError/IOError it raised}
+    def _fan_out(self, motors, call):
+        level = current_priority()
+
+        def run(shard, part):
+            with priority(level):
+                try:
+                    return call(shard, part)
+                except (RuntimeError, IOError) as e:
+                    return e
+
+        futures = {devicename: self.workers[devicename].submit(run, self.shards[devicename], part)
+                   for devicename, part in self._split(motors).items()}
+        return {devicename: future.result() for devicename, future in futures.items()}
+
+    # Like _fan_out, but raises the first error of any port
+    def _fan_out_all(self, motors, call):
+        results = self._fan_out(motors, call)
+        for result in results.values():
+            if isinstance(result, Exception):
+                raise result
+        return results
+
+    def open_port(self):
+        self._fan_out_all(self.ports, lambda shard, part: shard.open_port())
+
+    def close_port(self):
+        self._fan_out(self.ports, lambda shard, part: shard.close_port())
+
+    def reboot(self, motor_id):
+        self._shard(motor_id).reboot(motor_id)
+
+    def _write_register(self, motor_id, address, value):
+        self._shard(motor_id)._write_register(motor_id, address, value)
+
+    def _write_data(self, motor_id, address, data, length, description):
+        self._shard(motor_id)._write_data(motor_id, address, data, length, description)
+
+    def _write_position(self, motor_id, position):
+        self._shard(motor_id)._write_position(motor_id, position)
+
+    # With partial, a port that fails only loses its own motors; the read fails if every port did
+    def _read_sync_group(self, sync_read, motor_ids, address, length, partial=False):
+        motor_ids = list(self.ports) if motor_ids is None else list(motor_ids)
+        name = self.sync_read_names.get(id(sync_read))
+        results = self._fan_out(motor_ids, lambda shard, part: shard._read_sync_group(
+            getattr(shard, name) if name else GroupSyncRead(shard.port_handler, shard.packet_handler, address, length),
+            part, address, length, partial))
+        data = {}
+        errors = []
+        for result in results.values():
+            if isinstance(result, Exception):
+                errors.append(result)
+            else:
+                data.update(result)
+        if errors and (not partial or not data):
+            raise errors[0]
+        return data
+
+    def _set_torques(self, motor_ids, enable):
+        self._fan_out_all(motor_ids, lambda shard, part: shard._set_torques(part, enable))
+
+    def _set_status_return_level(self, motor_ids, level):
+        self._fan_out_all(motor_ids, lambda shard, part: shard._set_status_return_level(part, level))
+
+    def set_fast_writes(self, enable, motor_ids=None):
+        self._fan_out_all(list(self.ports) if motor_ids is None else motor_ids, lambda shard, part: shard.set_fast_writes(enable, part))
+        self.fast_writes = enable
+
+    def set_modes(self, modes):
+        self._fan_out_all(modes, lambda shard, part: shard.set_modes(part))
+        self.motor_modes.update(modes)
+
+    # The shards switch the modes themselves, motor_modes is kept in step with them and the driver's
+    # velocity watchdog sees the velocities of every port
+    def set_positions(self, positions, mode="extpos"):
+        self._fan_out_all(positions, lambda shard, part: shard.set_positions(part, mode))
+        self.motor_modes.update({motor_id: mode for motor_id in positions})
+
+    def set_velocities(self, velocities):
+        self._fan_out_all(velocities, lambda shard, part: shard.set_velocities(part))
+        self.motor_modes.update({motor_id: "vel" for motor_id in velocities})
+        self.velocity_watchdog.touch(velocities)
+
+    def get_health(self):
+        health = {}
+        for shard in self.shards.values():
+            health.update(shard.get_health())
+        return health
+
+    def reset_health(self):
+        for shard in self.shards.values():
+            shard.reset_health()
+
+    # Alerts are cleared by the shard of the motor, which keeps its fault
+    def get_faults(self):
+        faults = {}
+        for shard in self.shards.values():
+            faults.update(shard.get_faults())
+        return faults
+
+    def _pop_faults(self, motor_ids):
+        return [motor_id for shard in self.shards.values() for motor_id in shard._pop_faults(motor_ids)]
+
+
+# Returns a driver_class instance (e.g. Dynamixel6) with its motors on several ports {devicename: [motor_id]}
+# The ports come from the PORTS entry of the driver's config when not given; without any, a plain
+# driver on DEVICENAME is returned
+def multi_port(driver_class, ports=None):
+    if ports is None:
+        ports = sys.modules[driver_class.__module__].CONFIG.load().get("PORTS")
+    if not ports:
+        return driver_class()
+    cls = type(f"MultiPort{driver_class.__name__}", (MultiPortDriver, driver_class), {"driver_class": driver_class})
+    return cls(ports)
@@ -0,0 +1,134 @@
+import threading
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# PID over several axes at once, all arguments broadcast over the axes
+# The derivative acts on the measurement (no kick on setpoint changes) through a first-order filter
+# with time constant d_filter (s); the integral stops growing while the output is saturated
+# in the direction of the error, so it does not wind up against max_output
+class PIDController:
+
+    def __init__(self, n_axes, kp, ki=0.0, kd=0.0, max_output=100, d_filter=0.05):
+        self.n = n_axes
+        self.set_gains(kp, ki, kd)
+        self.max_output = np.broadcast_to(np.asarray(max_output, dtype=float), (n_axes,))
+        self.d_filter = d_filter
+        self.reset()
+
+    def set_gains(self, kp=None, ki=None, kd=None):
+        if kp is not None:
+            self.kp = np.broadcast_to(np.asarray(kp, dtype=float), (self.n,)).copy()
+        if ki is not None:
+            self.ki = np.broadcast_to(np.asarray(ki, dtype=float), (self.n,)).copy()
+        if kd is not None:
+            self.kd = np.broadcast_to(np.asarray(kd, dtype=float), (self.n,)).copy()
+
+    def reset(self):
+        self.integral = np.zeros(self.n)
+        self.derivative = np.zeros(self.n)
+        self.last_measurement = np.full(self.n, np.nan)
+
+    # Returns the outputs for one step of dt seconds, axes with a NaN measurement output 0
+    def step(self, setpoint, measurement, dt):
+        measurement = np.asarray(measurement, dtype=float)
+        valid = ~np.isnan(measurement)
+        error = np.where(valid, np.asarray(setpoint, dtype=float) - measurement, 0)
+
+        rate = np.where(np.isnan(self.last_measurement) | ~valid, 0, (measurement - self.last_measurement) / dt)
+        alpha = self.d_filter / (self.d_filter + dt)
+        self.derivative = alpha * self.derivative + (1 - alpha) * -rate
+        self.last_measurement = np.where(valid, measurement, np.nan)
+
+        unsaturated = self.kp * error + self.ki * self.integral + self.kd * self.derivative
+        winding = (np.abs(unsaturated) >= self.max_output) & (np.sign(error) == np.sign(unsaturated))
+        self.integral = np.where(valid & ~winding, self.integral + error * dt, self.integral)
+
+        output = self.kp * error + self.ki * self.integral + self.kd * self.derivative
+        return np.where(valid, np.clip(output, -self.max_output, self.max_output), 0)
+
+
+# Returns a function that reads the travel (mm) of the given optical readers in one pass
+# Readers that are missing or not initialised read as NaN
+def optical_measure(readers):
+    def measure():
+        travel = np.full(len(readers), np.nan)
+        for i, reader in enumerate(readers):
+            if reader is not None and reader.initialised:
+                with reader.lock:
+                    travel[i] = reader.y
+        return travel
+    return measure
+
+
+# Closed-loop velocity control of several motors at a fixed rate
+# Each tick takes one measurement snapshot of all axes, runs the PID for all of them and sends the
+# velocities in one GOAL_VELOCITY sync write; setpoints and gains can be changed while it runs
+class PIDService(QThread):
+
+    updated = pyqtSignal(dict)
+
+    def __init__(self, dnx, motor_ids, measure, kp, ki=0.0, kd=0.0, max_output=100, d_filter=0.05, rate=100):
+        super().__init__()
+        self.dnx = dnx
+        self.motor_ids = list(motor_ids)
+        self.measure = measure  # Returns one measurement per motor, e.g. optical_measure(...)
+        self.controller = PIDController(len(self.motor_ids), kp, ki, kd, max_output, d_filter)
+        self.setpoints = np.full(len(self.motor_ids), np.nan)  # NaN = hold the first measurement
+        self.errors = np.full(len(self.motor_ids), np.nan)
+        self.period = 1 / rate
+        self.logger = None  # Optional SessionLogger, every velocity write is logged
+        self.running = True
+        self.lock = threading.Lock()
+
+    # Sets the setpoints of some motors {motor_id: setpoint}
+    def set_setpoints(self, setpoints):
+        with self.lock:
+            for motor_id, setpoint in setpoints.items():
+                self.setpoints[self.motor_ids.index(motor_id)] = setpoint
+
+    def set_gains(self, kp=None, ki=None, kd=None):
+        with self.lock:
+            self.controller.set_gains(kp, ki, kd)
+
+    # Returns {motor_id: setpoint - measurement} from the last tick
+    def get_errors(self):
+        with self.lock:
+            return dict(zip(self.motor_ids, self.errors.tolist()))
+
+    def run(self):
+        last_tick = time.monotonic()
+        next_tick = last_tick + self.period
+        while self.running:
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            now = time.monotonic()
+            measurement = np.asarray(self.measure(), dtype=float)
+            with self.lock:
+                hold = np.isnan(self.setpoints)
+                self.setpoints[hold] = measurement[hold]
+                output = self.controller.step(self.setpoints, measurement, now - last_tick)
+                self.errors = self.setpoints - measurement
+            last_tick = now
+            velocities = dict(zip(self.motor_ids, np.rint(output).astype(int).tolist()))
+            try:
+                self.dnx.set_velocities(velocities)
+            except RuntimeError as e:
+                print(f"PID write failed: {e}")
+            else:
+                if self.logger is not None:
+                    self.logger.log_command(now, velocities)
+            self.updated.emit({"time": now, "velocity": velocities, "error": dict(zip(self.motor_ids, self.errors.tolist()))})
+            next_tick += self.period
+            if next_tick < now:
+                next_tick = now + self.period  # Overran, don't try to catch up
+
+        try:
+            self.dnx.set_velocities({motor_id: 0 for motor_id in self.motor_ids})
+        except RuntimeError as e:
+            print(f"PID stop failed: {e}")
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,279 @@
+import argparse
+import asyncio
+import json
+import math
+import socket
+import struct
+import threading
+import time
+from collections import deque
+
+from PyQt5.QtCore import QThread
+
+REMOTE_PORT = 8765  # TCP port of the server, on localhost unless another host is given
+MAX_FRAME = 65536  # Largest payload (bytes) accepted from a peer
+MAX_BUFFERED = 65536  # A subscriber with more unsent bytes than this skips snapshots until it catches up
+
+# Every frame is a HEADER (kind, payload length) followed by the payload
+HEADER = struct.Struct("<BI")
+LAYOUT, SNAPSHOT, RATE, COMMAND, ERROR = range(5)
+MISSING = -2 ** 31  # Motor value not in the snapshot, e.g. a motor that did not answer
+COMMAND_ENTRY = struct.Struct("<Bi")  # motor_id, velocity
+
+
+def encode_frame(kind, payload=b""):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+# Layout sent once to every client: which fields and motors the snapshot values are, in order
+def snapshot_layout(fields, motor_ids, n_optical):
+    return {"fields": list(fields), "motor_ids": list(motor_ids), "optical": n_optical}
+
+
+# SNAPSHOT payload: time (double), every field of every motor (int32, MISSING if absent), then the
+# x and y travel (mm, double) of each optical reader (NaN if absent)
+def pack_snapshot(layout, snapshot, optical=()):
+    values = [snapshot.get(field, {}).get(motor_id, math.nan) for field in layout["fields"] for motor_id in layout["motor_ids"]]
+    values = [MISSING if math.isnan(value) else int(value) for value in values]
+    travel = [value for x, y in optical for value in (x, y)]
+    return struct.pack(f"<d{len(values)}i{len(travel)}d", snapshot.get("time", math.nan), *values, *travel)
+
+
+# Returns the snapshot in the TelemetryThread form {"time": t, field: {motor_id: value}}, with the
+# optical readers (numbered from 1) under "optical_x" and "optical_y"
+def unpack_snapshot(layout, payload):
+    fields, motor_ids, n_optical = layout["fields"], layout["motor_ids"], layout["optical"]
+    n_values = len(fields) * len(motor_ids)
+    t, *rest = struct.unpack(f"<d{n_values}i{2 * n_optical}d", payload)
+    snapshot = {"time": t}
+    for i, field in enumerate(fields):
+        row = rest[i * len(motor_ids):(i + 1) * len(motor_ids)]
+        snapshot[field] = {motor_id: value for motor_id, value in zip(motor_ids, row) if value != MISSING}
+    travel = rest[n_values:]
+    snapshot["optical_x"] = {i + 1: travel[2 * i] for i in range(n_optical)}
+    snapshot["optical_y"] = {i + 1: travel[2 * i + 1] for i in range(n_optical)}
+    return snapshot
+
+
+# Returns the (x, y) travel (mm) of each SerialReader of an Optical4, NaN for missing or uninitialised ones
+def read_travel(readers):
+    travel = []
+    for reader in readers:
+        if reader is not None and reader.initialised:
+            with reader.lock:
+                travel.append((reader.x, reader.y))
+        else:
+            travel.append((math.nan, math.nan))
+    return travel
+
+
+def pack_command(velocities):
+    return b"".join(COMMAND_ENTRY.pack(motor_id, int(velocity)) for motor_id, velocity in velocities.items())
+
+
+def unpack_command(payload):
+    return {motor_id: velocity for motor_id, velocity in COMMAND_ENTRY.iter_unpack(payload)}
+
+
+# Publishes the snapshots of a TelemetryThread, plus the travel of optical readers, to any number of
+# TCP clients, so monitoring processes can watch without opening the serial ports themselves
+# Each client gets the snapshots at the rate it asks for (at most rate), a slow client skips snapshots
+# instead of queueing them; velocity commands from clients are posted to the
+# CommandBus (none accepted without one) at up to command_rate per client per second; the motors a
+# client left moving are zeroed when it disconnects or dies
+class TelemetryServer(QThread):
+
+    def __init__(self, telemetry, bus=None, readers=(), host="127.0.0.1", port=REMOTE_PORT, rate=20, command_rate=20):
+        super().__init__()
+        self.telemetry = telemetry
+        self.bus = bus
+        self.readers = list(readers)  # SerialReaders of an Optical4, None for the missing ones
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.command_rate = command_rate
+        self.layout = snapshot_layout(telemetry.fields, telemetry.motor_ids, len(self.readers))
+        self.clients = {}  # {writer: handler task}
+        self.loop = None
+        self.stopped = None
+        self.running = True
+
+    async def _publish(self, writer, client):
+        last_time = None
+        while True:
+            await asyncio.sleep(1 / client["rate"])
+            snapshot = self.telemetry.latest()
+            if not snapshot or snapshot["time"] == last_time:
+                continue
+            if writer.transport.get_write_buffer_size() > MAX_BUFFERED:
+                continue
+            last_time = snapshot["time"]
+            writer.write(encode_frame(SNAPSHOT, pack_snapshot(self.layout, snapshot, read_travel(self.readers))))
+
+    # Token bucket of command_rate commands per second per client
+    def _allow_command(self, client):
+        now = time.monotonic()
+        client["tokens"] = min(self.command_rate, client["tokens"] + (now - client["refilled"]) * self.command_rate)
+        client["refilled"] = now
+        if client["tokens"] < 1:
+            return False
+        client["tokens"] -= 1
+        return True
+
+    def _handle_frame(self, writer, client, kind, payload):
+        if kind == RATE:
+            requested, = struct.unpack("<d", payload)
+            if not math.isfinite(requested):
+                writer.write(encode_frame(ERROR, f"Invalid rate {requested}".encode()))
+                return
+            client["rate"] = min(max(requested, 0.1), self.rate)
+        elif kind == COMMAND:
+            velocities = unpack_command(payload)
+            if self.bus is None:
+                writer.write(encode_frame(ERROR, b"Commands not accepted"))
+            elif not set(velocities) <= set(self.layout["motor_ids"]):
+                writer.write(encode_frame(ERROR, f"Unknown IDs {sorted(set(velocities) - set(self.layout['motor_ids']))}".encode()))
+            elif not self._allow_command(client):
+                writer.write(encode_frame(ERROR, b"Command rate exceeded"))
+            else:
+                client["armed"] |= {motor_id for motor_id, velocity in velocities.items() if velocity}
+                client["armed"] -= {motor_id for motor_id, velocity in velocities.items() if not velocity}
+                self.bus.post_many(velocities)
+        else:
+            writer.write(encode_frame(ERROR, f"Unknown frame kind {kind}".encode()))
+
+    async def _serve_client(self, reader, writer):
+        client = {"rate": self.rate, "tokens": self.command_rate, "refilled": time.monotonic(), "armed": set()}
+        self.clients[writer] = asyncio.current_task()
+        writer.write(encode_frame(LAYOUT, json.dumps(self.layout).encode()))
+        publisher = asyncio.create_task(self._publish(writer, client))
+        try:
+            while True:
+                kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if length > MAX_FRAME:
+                    break
+                self._handle_frame(writer, client, kind, await reader.readexactly(length))
+        except (asyncio.IncompleteReadError, ConnectionError, struct.error):
+            pass
+        finally:
+            publisher.cancel()
+            if client["armed"]:
+                self.bus.post_many({motor_id: 0 for motor_id in client["armed"]})
+                print(f"Remote client gone, IDs {sorted(client['armed'])} stopped")
+            self.clients.pop(writer, None)
+            writer.close()
+
+    async def _main(self):
+        self.stopped = asyncio.Event()
+        self.loop = asyncio.get_running_loop()
+        server = await asyncio.start_server(self._serve_client, self.host, self.port)
+        print(f"Serving telemetry on {self.host}:{self.port}")
+        async with server:
+            if self.running:
+                await self.stopped.wait()
+            for writer in list(self.clients):
+                writer.close()  # Ends the handler at its next read
+            await asyncio.gather(*self.clients.values(), return_exceptions=True)
+
+    def run(self):
+        try:
+            asyncio.run(self._main())
+        except OSError as e:
+            print(f"Telemetry server failed: {e}")
+        self.loop = None
+
+    def stop(self):
+        self.running = False
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.stopped.set)
+
+
+# Client of a TelemetryServer for scripts and other processes
+# A background thread keeps the latest snapshot (see unpack_snapshot) and calls the listeners with each
+class RemoteClient:
+
+    def __init__(self, host="127.0.0.1", port=REMOTE_PORT, rate=None):
+        self.sock = socket.create_connection((host, port))
+        self.send_lock = threading.Lock()
+        kind, payload = self._receive()
+        if kind != LAYOUT:
+            raise IOError(f"Expected the layout from {host}:{port}, got frame kind {kind}")
+        self.layout = json.loads(payload)
+        self.snapshot = {}
+        self.errors = deque(maxlen=100)  # Last messages from the server, e.g. rejected commands
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.connected = True
+        self.thread = threading.Thread(target=self._listen, daemon=True)
+        self.thread.start()
+        if rate is not None:
+            self.set_rate(rate)
+
+    def _receive_exactly(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.sock.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("Server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    def _receive(self):
+        kind, length = HEADER.unpack(self._receive_exactly(HEADER.size))
+        return kind, self._receive_exactly(length)
+
+    def _send(self, kind, payload):
+        with self.send_lock:
+            self.sock.sendall(encode_frame(kind, payload))
+
+    def _listen(self):
+        try:
+            while True:
+                kind, payload = self._receive()
+                if kind == SNAPSHOT:
+                    snapshot = unpack_snapshot(self.layout, payload)
+                    with self.lock:
+                        self.snapshot = snapshot
+                    for listener in self.listeners:
+                        listener(snapshot)
+                elif kind == ERROR:
+                    self.errors.append(payload.decode())
+        except (ConnectionError, OSError):
+            self.connected = False
+
+    def latest(self):
+        with self.lock:
+            return self.snapshot
+
+    # Calls listener(snapshot) from the client thread for every snapshot received
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    # Asks for snapshots at rate (Hz), the server caps it at its own rate
+    def set_rate(self, rate):
+        self._send(RATE, struct.pack("<d", rate))
+
+    def send_velocities(self, velocities):
+        self._send(COMMAND, pack_command(velocities))
+
+    def close(self):
+        self.sock.close()
+        self.thread.join(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Print the telemetry of a running GUI started with --serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=REMOTE_PORT)
+    parser.add_argument("--rate", type=float, default=2, help="Snapshots per second")
+    args = parser.parse_args()
+
+    client = RemoteClient(args.host, args.port, args.rate)
+    client.subscribe(lambda snapshot: print({field: values for field, values in snapshot.items() if values}))
+    try:
+        while client.connected:
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        client.close()
@@ -0,0 +1,299 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from motor_ctrl.session_log import load_session
+
+LISTENER_POLL = 0.002  # s between checks of a replayed optical stream for rows to hand to its listeners
+
+# Recorded session played back on a clock, either in real time (scaled by speed) or, with speed=None,
+# as fast as possible: the clock then only moves when the driver stream is read, one recorded row per read,
+# so every consumer sees the same sequence of samples on every run
+class ReplaySession:
+
+    def __init__(self, path, speed=1.0, driver="telemetry"):
+        self.path = path
+        self.streams = {}
+        for name, stream in load_session(path).items():
+            data = stream.data()
+            self.streams[name] = (stream.columns, data[:, 0].copy(), data)
+        if not self.streams:
+            raise ValueError(f"No streams recorded in {path}")
+        self.start = min(times[0] for _, times, _ in self.streams.values() if len(times))
+        self.end = max(times[-1] for _, times, _ in self.streams.values() if len(times))
+        self.speed = speed
+        self.driver = driver
+        self.t = self.start
+        self.wall_start = None
+        self.lock = threading.Lock()
+
+    # Current session time
+    def now(self):
+        if self.speed is None:
+            return self.t
+        if self.wall_start is None:
+            self.wall_start = time.monotonic()
+        return self.start + (time.monotonic() - self.wall_start) * self.speed
+
+    # time.monotonic() at which session time t is played, so replayed samples line up with live clocks;
+    # as fast as possible there is no such time and samples get the time they are handed over
+    def monotonic(self, t):
+        if self.speed is None or self.wall_start is None:
+            return time.monotonic()
+        return self.wall_start + (t - self.start) / self.speed
+
+    def finished(self):
+        return self.now() >= self.end
+
+    # As fast as possible: moves the clock to the next row of stream if it drives the replay
+    def step(self, stream):
+        if self.speed is not None or stream != self.driver or stream not in self.streams:
+            return
+        with self.lock:
+            _, times, _ = self.streams[stream]
+            i = np.searchsorted(times, self.t, side="right")
+            if i < len(times):
+                self.t = times[i]
+
+    # Returns {column: value} of the last row of stream at or before the current time, None before the first
+    def sample(self, stream):
+        if stream not in self.streams:
+            return None
+        columns, times, data = self.streams[stream]
+        i = np.searchsorted(times, self.now(), side="right") - 1
+        if i < 0:
+            return None
+        return dict(zip(columns, data[i].tolist()))
+
+
+# Stands in for the Dynamixel* classes on a ReplaySession
+# Reads return the recorded telemetry, writes are kept in commands as (time, kind, {motor_id: value})
+# so the output of a GUI or controller can be compared with what was sent during the recording
+class ReplayDynamixel:
+
+    def __init__(self, session):
+        self.session = session
+        columns = session.streams["telemetry"][0] if "telemetry" in session.streams else []
+        self.motor_ids = [int(column.split("_")[1]) for column in columns if column.startswith("position_")]
+        self.motor_pos0 = {motor_id: 0 for motor_id in self.motor_ids}
+        self.motor_modes = {motor_id: "" for motor_id in self.motor_ids}
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def _read_group(self, field, motor_ids):
+        if field == "position":
+            self.session.step("telemetry")
+        row = self.session.sample("telemetry") or {}
+        motor_ids = self.motor_ids if motor_ids is None else motor_ids
+        values = {motor_id: row.get(f"{field}_{motor_id}", 0) for motor_id in motor_ids}
+        return {motor_id: int(value) if float(value).is_integer() else value for motor_id, value in values.items()}  # Registers are integers
+
+    def _record(self, kind, values):
+        with self.lock:
+            self.commands.append((self.session.now(), kind, dict(values)))
+
+    def open_port(self):
+        print(f"Replaying {self.session.path}")
+
+    def close_port(self):
+        print("Replay finished" if self.session.finished() else "Replay stopped")
+
+    def enable_torque(self, motor_id):
+        pass
+
+    def disable_torque(self, motor_id):
+        pass
+
+    def enable_torques(self, motor_ids=None):
+        pass
+
+    def disable_torques(self, motor_ids=None):
+        pass
+
+    def reboot(self, motor_id):
+        pass
+
+    def get_faults(self):
+        return {}
+
+    def clear_faults(self, motor_ids=None):
+        return []
+
+    def set_fast_writes(self, enable, motor_ids=None):
+        pass
+
+    def set_mode(self, motor_id, mode):
+        self.motor_modes[motor_id] = mode
+
+    def set_modes(self, modes):
+        self.motor_modes.update(modes)
+
+    def set_profile_acceleration(self, motor_id, acceleration):
+        pass
+
+    def set_profile_velocity(self, motor_id, velocity):
+        pass
+
+    def get_positions(self, motor_ids=None, partial=False):
+        return self._read_group("position", motor_ids)
+
+    def get_velocities(self, motor_ids=None, partial=False):
+        return self._read_group("velocity", motor_ids)
+
+    def get_currents(self, motor_ids=None, partial=False):
+        return self._read_group("current", motor_ids)
+
+    def get_voltages(self, motor_ids=None, partial=False):
+        return self._read_group("voltage", motor_ids)
+
+    def get_temperatures(self, motor_ids=None, partial=False):
+        return self._read_group("temperature", motor_ids)
+
+    def get_profile_velocities(self, motor_ids=None, partial=False):
+        return {motor_id: 0 for motor_id in (self.motor_ids if motor_ids is None else motor_ids)}
+
+    def get_moving_statuses(self, motor_ids=None, partial=False):
+        return {motor_id: 1 for motor_id in (self.motor_ids if motor_ids is None else motor_ids)}
+
+    def get_position(self, motor_id):
+        return self.get_positions([motor_id])[motor_id]
+
+    def get_velocity(self, motor_id):
+        return self.get_velocities([motor_id])[motor_id]
+
+    def get_current(self, motor_id):
+        return self.get_currents([motor_id])[motor_id]
+
+    def get_voltage(self, motor_id):
+        return self.get_voltages([motor_id])[motor_id]
+
+    def get_temperature(self, motor_id):
+        return self.get_temperatures([motor_id])[motor_id]
+
+    def has_arrived(self, motor_id):
+        return 1
+
+    def set_velocity(self, motor_id, velocity):
+        self._record("velocity", {motor_id: velocity})
+
+    def set_velocities(self, velocities):
+        self._record("velocity", velocities)
+
+    def set_position(self, motor_id, position, vel=None, mode="extpos"):
+        self._record("position", {motor_id: position})
+
+    def set_positions(self, positions, mode="extpos"):
+        self._record("position", positions)
+
+    def define_position0(self, motor_id):
+        self.motor_pos0[motor_id] = self.get_position(motor_id)
+
+    def define_allpos0(self):
+        for motor_id in self.motor_ids:
+            self.define_position0(motor_id)
+
+    # Names used by the different Dynamixel* classes
+    define_dualpos0 = define_quadpos0 = def_quadpos0 = define_allpos0
+
+
+# Stands in for a SerialReader, x and y (mm) follow the optical<index> stream of the session
+# Setting x or y (e.g. a position reset) offsets the recorded values, like it does on the real reader
+# Once started, listeners are called with (time, dx, dy, x, y) for every recorded row the clock passes
+class ReplaySerialReader:
+
+    def __init__(self, session, index):
+        self.session = session
+        self.stream = f"optical{index}"
+        self.serialCom = SimpleNamespace(name=f"replay{index}")
+        self.dpi = None
+        self.initialised = True
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.offset = {"x": 0.0, "y": 0.0}
+        self.row = 0  # Next row of the stream for the listeners
+        self.thread = None
+        self.running = False
+
+    def _value(self, axis):
+        row = self.session.sample(self.stream)
+        return (row[axis] if row else 0.0) - self.offset[axis]
+
+    @property
+    def x(self):
+        return self._value("x")
+
+    @x.setter
+    def x(self, value):
+        self.offset["x"] += self._value("x") - value
+
+    # Reading y (the segment travel) steps an as-fast-as-possible replay driven by this reader
+    @property
+    def y(self):
+        self.session.step(self.stream)
+        return self._value("y")
+
+    @y.setter
+    def y(self, value):
+        self.offset["y"] += self._value("y") - value
+
+    # Calls the listeners with the rows played since the last call
+    def _emit(self):
+        columns, times, data = self.session.streams[self.stream]
+        end = np.searchsorted(times, self.session.now(), side="right")
+        with self.lock:
+            rows = [dict(zip(columns, row)) for row in data[self.row:end].tolist()]
+            self.row = max(self.row, end)
+            offset = dict(self.offset)
+        for row in rows:
+            for listener in self.listeners:
+                listener(self.session.monotonic(row["time"]), row["dx"], row["dy"], row["x"] - offset["x"], row["y"] - offset["y"])
+
+    def _run(self):
+        while self.running:
+            self._emit()
+            time.sleep(LISTENER_POLL)
+
+    def start(self):
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self._run, name=self.serialCom.name, daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+# Stands in for Optical4, readers are None for the encoders that were not recorded
+class ReplayOptical4:
+
+    def __init__(self, session):
+        self.session = session
+        readers = [ReplaySerialReader(session, i) if f"optical{i}" in session.streams else None for i in range(1, 5)]
+        self.serial_reader1, self.serial_reader2, self.serial_reader3, self.serial_reader4 = readers
+        self.connections = {f"replay{i}": reader is not None for i, reader in enumerate(readers, 1)}
+
+    def connect(self):
+        return tuple(self.connections.values())
+
+    def _readers(self):
+        return [reader for reader in (self.serial_reader1, self.serial_reader2, self.serial_reader3, self.serial_reader4) if reader is not None]
+
+    def start_burst(self):
+        for reader in self._readers():
+            reader.start()
+        return any(self.connections.values())
+
+    def start_camera(self):
+        return False
+
+    def close(self):
+        for reader in self._readers():
+            reader.stop()
+            reader.wait()
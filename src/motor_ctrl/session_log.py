@@ -0,0 +1,139 @@
+import glob
+import json
+import os
+import queue
+from datetime import datetime
+
+import numpy as np
+from PyQt5.QtCore import QThread
+
+SESSION_DIR = 'exports/sessions' # Change the directory to save the sessions if needed
+CHUNK_ROWS = 4096 # Rows per .npy chunk
+QUEUE_SIZE = 10000 # Rows waiting to be written before new ones are dropped
+
+# Records timestamped rows of several streams into an append-only folder of .npy chunks
+# session/manifest.json lists the columns of every stream, session/<stream>/000000.npy, 000001.npy, ...
+# hold float64 rows of [time, columns...] stored column by column; a chunk is never rewritten once saved
+# log() only puts the row on a bounded queue, the files are written by this thread, so a full disk or
+# a slow write never blocks the caller; rows that do not fit in the queue are counted in dropped
+class SessionLogger(QThread):
+
+    def __init__(self, path=None, chunk_rows=CHUNK_ROWS, queue_size=QUEUE_SIZE):
+        super().__init__()
+        self.path = path or os.path.join(SESSION_DIR, datetime.now().strftime('%Y-%m-%d_%H-%M-%S'))
+        self.chunk_rows = chunk_rows
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.columns = {}
+        self.telemetry_keys = []
+        self.dropped = 0
+        self.running = True
+
+    # Declares a stream and its column names, must be called before logging to it
+    def define(self, stream, columns):
+        if stream in self.columns:
+            return
+        self.columns[stream] = list(columns)
+        self.queue.put(("define", stream, list(columns)))
+
+    def log(self, stream, t, values):
+        try:
+            self.queue.put_nowait(("row", stream, (t, *values)))
+        except queue.Full:
+            self.dropped += 1
+
+    # Declares the telemetry stream with a column for every field of every motor, e.g. from the fields
+    # and motor_ids of the TelemetryThread; a motor missing from a partial snapshot is logged as NaN
+    def define_telemetry(self, fields, motor_ids):
+        if "telemetry" in self.columns:
+            return
+        self.telemetry_keys = [(field, motor_id) for field in fields for motor_id in motor_ids]
+        self.define("telemetry", [f"{field}_{motor_id}" for field, motor_id in self.telemetry_keys])
+
+    # Logs a telemetry snapshot {"time": t, field: {motor_id: value}} as one row of the telemetry stream
+    # Without define_telemetry, the columns are those of the first snapshot
+    def log_snapshot(self, snapshot):
+        if "telemetry" not in self.columns:
+            fields = [field for field, per_motor in snapshot.items() if isinstance(per_motor, dict)]
+            self.define_telemetry(fields, sorted({motor_id for field in fields for motor_id in snapshot[field]}))
+        self.log("telemetry", snapshot["time"], [snapshot.get(field, {}).get(motor_id, np.nan) for field, motor_id in self.telemetry_keys])
+
+    # Logs the velocities {motor_id: velocity} sent in one command, one row per motor
+    def log_command(self, t, velocities):
+        self.define("command", ["motor_id", "velocity"])
+        for motor_id, velocity in velocities.items():
+            self.log("command", t, (motor_id, velocity))
+
+    # Returns a SerialReader listener that logs the samples of that reader into stream optical<index>
+    def optical_listener(self, index):
+        stream = f"optical{index}"
+        self.define(stream, ["dx", "dy", "x", "y"])
+        return lambda t, dx, dy, x, y: self.log(stream, t, (dx, dy, x, y))
+
+    def run(self):
+        os.makedirs(self.path, exist_ok=True)
+        columns = {}
+        buffers = {}
+        fill = {}
+        chunk = {}
+        while self.running or not self.queue.empty():
+            try:
+                kind, stream, payload = self.queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if kind == "define":
+                columns[stream] = payload
+                buffers[stream] = np.empty((self.chunk_rows, len(payload) + 1))
+                fill[stream], chunk[stream] = 0, 0
+                os.makedirs(os.path.join(self.path, stream), exist_ok=True)
+                with open(os.path.join(self.path, 'manifest.json'), 'w') as manifest_file:
+                    json.dump({name: ["time"] + cols for name, cols in columns.items()}, manifest_file, indent=2)
+                continue
+            buffers[stream][fill[stream]] = payload
+            fill[stream] += 1
+            if fill[stream] == self.chunk_rows:
+                self._save_chunk(stream, buffers[stream], chunk[stream])
+                fill[stream] = 0
+                chunk[stream] += 1
+        for stream in buffers:
+            if fill[stream]:
+                self._save_chunk(stream, buffers[stream][:fill[stream]], chunk[stream])
+        if self.dropped:
+            print(f"Session log dropped {self.dropped} rows")
+
+    # Column-major (Fortran order) on disk, so each column of a chunk is one contiguous run of the file
+    def _save_chunk(self, stream, rows, index):
+        np.save(os.path.join(self.path, stream, f"{index:06d}.npy"), np.asfortranarray(rows))
+
+    # Stops after writing everything already queued
+    def stop(self):
+        self.running = False
+
+
+# One stream of a recorded session, the chunks are memory-mapped and only read when accessed
+class StreamLog:
+
+    def __init__(self, path, columns):
+        self.columns = columns
+        self.chunks = [np.load(file, mmap_mode='r') for file in sorted(glob.glob(os.path.join(path, "*.npy")))]
+
+    def __len__(self):
+        return sum(len(chunk) for chunk in self.chunks)
+
+    # All rows as one array (copies the chunks)
+    def data(self):
+        if not self.chunks:
+            return np.empty((0, len(self.columns)))
+        return np.concatenate(self.chunks)
+
+    # One column by name as one array, only the pages of that column are read from the chunks
+    # (sessions recorded before the chunks were column-major still load, reading whole rows)
+    def column(self, name):
+        i = self.columns.index(name)
+        return np.concatenate([chunk[:, i] for chunk in self.chunks]) if self.chunks else np.empty(0)
+
+
+# Opens a session folder written by SessionLogger, returns {stream: StreamLog}
+def load_session(path):
+    with open(os.path.join(path, 'manifest.json'), 'r') as manifest_file:
+        manifest = json.load(manifest_file)
+    return {stream: StreamLog(os.path.join(path, stream), columns) for stream, columns in manifest.items()}
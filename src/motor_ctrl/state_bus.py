@@ -0,0 +1,236 @@
+import argparse
+import json
+import math
+import os
+import struct
+import sys
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+try:
+    from motor_ctrl.bus_tune import SETUPS, load_setup
+    from motor_ctrl.multi_port import multi_port
+    from motor_ctrl.remote import MISSING, read_travel, snapshot_layout
+    from motor_ctrl.telemetry import TELEMETRY_READERS, TelemetryThread
+except ImportError:  # Run as a script from src/motor_ctrl
+    from bus_tune import SETUPS, load_setup
+    from multi_port import multi_port
+    from remote import MISSING, read_travel, snapshot_layout
+    from telemetry import TELEMETRY_READERS, TelemetryThread
+
+STATE_NAME = "pbn_state"  # Shared memory name of the state block
+STATE_RATE = 100  # Hz, default poll rate of the I/O process
+# The block starts with MAGIC and the length of the layout JSON (see remote.snapshot_layout), then the
+# layout, then the state at the next multiple of 8 bytes: sequence number (uint64), snapshot time
+# (double), x and y travel of each optical reader (double) and every field of every motor (int32)
+PREFIX = struct.Struct("<4sI")
+MAGIC = b"PBNS"
+READ_TIMEOUT = 0.1  # s a read waits for a snapshot being written, a writer that died mid-write never finishes it
+
+
+def _state_size(layout):
+    return 16 + 16 * layout["optical"] + 4 * len(layout["fields"]) * len(layout["motor_ids"])
+
+
+# numpy arrays over the state in buf, so both sides read and write the shared memory in place
+def _state_views(buf, offset, layout):
+    n_optical = layout["optical"]
+    seq = np.ndarray((1,), np.uint64, buf, offset)
+    t = np.ndarray((1,), np.float64, buf, offset + 8)
+    optical = np.ndarray((n_optical, 2), np.float64, buf, offset + 16)
+    values = np.ndarray((len(layout["fields"]), len(layout["motor_ids"])), np.int32, buf, offset + 16 + 16 * n_optical)
+    return seq, t, optical, values
+
+
+# Attaches to an existing block without handing it to this process's resource tracker, which would
+# otherwise unlink it when a reader exits
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)  # Python 3.13+
+    except TypeError:
+        shm = shared_memory.SharedMemory(name)
+        if os.name == "posix":
+            resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+
+# Writes snapshots into a shared memory block that any number of StateReaders in other processes read
+# Only one process (the one owning the ports) writes; the sequence number is odd while a snapshot is
+# being written, so readers retry instead of seeing half of one (seqlock)
+class StateWriter:
+
+    def __init__(self, motor_ids, fields=tuple(TELEMETRY_READERS), n_optical=0, name=STATE_NAME):
+        self.layout = snapshot_layout(fields, motor_ids, n_optical)
+        header = json.dumps(self.layout).encode()
+        offset = -(-(PREFIX.size + len(header)) // 8) * 8
+        size = offset + _state_size(self.layout)
+        try:
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:  # Left behind by an I/O process that did not close
+            print(f"Replacing stale state block {name}")
+            stale = _attach(name)
+            stale.close()
+            stale.unlink()
+            self.shm = shared_memory.SharedMemory(name, create=True, size=size)
+        self.shm.buf[:PREFIX.size] = PREFIX.pack(MAGIC, len(header))
+        self.shm.buf[PREFIX.size:PREFIX.size + len(header)] = header
+        self.seq, self.time, self.optical, self.values = _state_views(self.shm.buf, offset, self.layout)
+        self.seq[0] = 0
+
+    # snapshot as from TelemetryThread.poll, optical as from remote.read_travel
+    def publish(self, snapshot, optical=()):
+        values = [[snapshot.get(field, {}).get(motor_id, MISSING) for motor_id in self.layout["motor_ids"]]
+                  for field in self.layout["fields"]]
+        self.seq[0] += 1
+        self.time[0] = snapshot.get("time", math.nan)
+        self.values[:] = values
+        if self.layout["optical"]:
+            self.optical[:] = optical
+        self.seq[0] += 1
+
+    def close(self):
+        self.seq = self.time = self.optical = self.values = None  # The views must go before the block
+        self.shm.close()
+        self.shm.unlink()
+
+
+# Reads the block of a StateWriter from any process, waiting up to timeout (s) for the writer to create it
+class StateReader:
+
+    def __init__(self, name=STATE_NAME, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self.shm = _attach(name)
+                break
+            except FileNotFoundError:
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+        magic, length = PREFIX.unpack_from(self.shm.buf)
+        if magic != MAGIC:
+            raise ValueError(f"{name} is not a state block")
+        self.layout = json.loads(bytes(self.shm.buf[PREFIX.size:PREFIX.size + length]))
+        self.motor_ids = self.layout["motor_ids"]
+        self.seq, self.time, self.optical, self.values = _state_views(self.shm.buf, -(-(PREFIX.size + length) // 8) * 8, self.layout)
+        self.seen = 0  # Sequence number of the last snapshot read
+        self.snapshot = {}  # Last snapshot read
+
+    # Returns the latest snapshot in the TelemetryThread form {"time": t, field: {motor_id: value}}, with the
+    # optical readers (numbered from 1) under "optical_x" and "optical_y"; {} until the first is written
+    # Raises TimeoutError if no whole snapshot can be read within timeout (s), e.g. the writer died mid-write
+    def read(self, timeout=READ_TIMEOUT):
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = int(self.seq[0])
+            if seq % 2 == 0:
+                t, optical, values = float(self.time[0]), self.optical.copy(), self.values.copy()
+                if int(self.seq[0]) == seq:
+                    break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"No complete snapshot in {self.shm.name} within {timeout} s, is the writer alive?")
+            time.sleep(0)
+        if seq == self.seen:
+            return self.snapshot
+        self.seen = seq
+        if not seq:
+            return {}
+        snapshot = {"time": t}
+        for field, row in zip(self.layout["fields"], values.tolist()):
+            snapshot[field] = {motor_id: value for motor_id, value in zip(self.motor_ids, row) if value != MISSING}
+        snapshot["optical_x"] = {i + 1: x for i, (x, _) in enumerate(optical.tolist())}
+        snapshot["optical_y"] = {i + 1: y for i, (_, y) in enumerate(optical.tolist())}
+        self.snapshot = snapshot
+        return snapshot
+
+    # Waits for a snapshot newer than the last read and returns it, or None after timeout (s)
+    def wait(self, timeout=1.0, poll=0.001):
+        deadline = time.monotonic() + timeout
+        while int(self.seq[0]) in (self.seen, self.seen + 1):
+            if time.monotonic() > deadline:
+                return None
+            time.sleep(poll)
+        return self.read()
+
+    # Seconds since the snapshot in the block was taken, the monotonic clock is shared by all processes
+    def age(self):
+        return time.monotonic() - float(self.time[0]) if int(self.seq[0]) else math.inf
+
+    def close(self):
+        self.seq = self.time = self.optical = self.values = None
+        self.shm.close()
+
+
+# TelemetryThread that also writes every poll, with the travel of the optical readers, to a StateWriter
+class StatePublisher(TelemetryThread):
+
+    def __init__(self, dnx, motor_ids, writer, readers=(), rate=STATE_RATE):
+        super().__init__(dnx, motor_ids, rate=rate, fields=tuple(writer.layout["fields"]))
+        self.writer = writer
+        self.readers = list(readers)
+
+    def poll(self):
+        snapshot = super().poll()
+        self.writer.publish(snapshot, read_travel(self.readers))
+        return snapshot
+
+
+# Starts the optical encoders in burst mode, returns the Optical4 and its four SerialReaders (None for missing ones)
+def open_optical():
+    try:
+        from opten_ctrl.opten_lib import Optical4
+    except ImportError:  # Run as a script from src/motor_ctrl
+        sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        from opten_ctrl.opten_lib import Optical4
+    optical = Optical4()
+    optical.start_burst()
+    return optical, [optical.serial_reader1, optical.serial_reader2, optical.serial_reader3, optical.serial_reader4]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Own the motor bus (and optical encoders) and publish their state to shared memory")
+    parser.add_argument("setup", nargs="?", choices=sorted(SETUPS), help="Which config_<setup>.json and driver to use")
+    parser.add_argument("--name", default=STATE_NAME, help="Shared memory name of the state block")
+    parser.add_argument("--rate", type=float, default=STATE_RATE, help="Polls per second")
+    parser.add_argument("--optical", action="store_true", help="Also publish the travel of the optical encoders")
+    parser.add_argument("--read", action="store_true", help="Print the state published by a running I/O process instead")
+    args = parser.parse_args()
+
+    if args.read:
+        reader = StateReader(args.name)
+        try:
+            while True:
+                snapshot = reader.wait()
+                if snapshot:
+                    print({field: values for field, values in snapshot.items() if values})
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            reader.close()
+        sys.exit()
+    if args.setup is None:
+        parser.error("setup is required unless --read is given")
+
+    module, driver_class = load_setup(args.setup)
+    motor_ids = list(module.MOTOR_IDS.values())
+    dnx = multi_port(driver_class)
+    dnx.open_port()
+    optical, readers = open_optical() if args.optical else (None, [])
+    writer = StateWriter(motor_ids, n_optical=len(readers), name=args.name)
+    publisher = StatePublisher(dnx, motor_ids, writer, readers, args.rate)
+    publisher.start()
+    print(f"Publishing IDs {motor_ids} to {args.name} at {args.rate} Hz")
+    try:
+        while publisher.isRunning():
+            time.sleep(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        publisher.stop()
+        publisher.wait()
+        writer.close()
+        if optical is not None:
+            optical.close()
+        dnx.close_port()
@@ -1,38 +1,51 @@
 
-import json
 import time
 import threading
+import numpy as np
 from dynamixel_sdk import *  # Uses Dynamixel SDK library
-
-# Load configuration from JSON file
-with open('src/motor_ctrl/config_clamp.json', 'r') as config_file:
-    config = json.load(config_file)
-
-# Extract settings from the config dictionary
-MOTOR_IDS = {
-    "MOTOR1_ID": config['MOTOR1_ID'],
-    "MOTOR2_ID": config['MOTOR2_ID'],
-    "MOTOR3_ID": config['MOTOR3_ID'],
-    "MOTOR4_ID": config['MOTOR4_ID'],
-    "MOTOR5_ID": config['MOTOR5_ID'],
-    "MOTOR6_ID": config['MOTOR6_ID']
-}
-MOTOR1_ID = MOTOR_IDS["MOTOR1_ID"]
-MOTOR2_ID = MOTOR_IDS["MOTOR2_ID"]
-MOTOR3_ID = MOTOR_IDS["MOTOR3_ID"]
-MOTOR4_ID = MOTOR_IDS["MOTOR4_ID"]
-MOTOR5_ID = MOTOR_IDS["MOTOR5_ID"]
-MOTOR6_ID = MOTOR_IDS["MOTOR6_ID"]
-
-BAUDRATE = config['BAUDRATE']
-DEVICENAME = config['DEVICENAME']
+try:
+    from motor_ctrl.motion_profile import arrival_times, synchronised_velocities
+    from motor_ctrl.config import ConfigFile
+    from motor_ctrl.bus_scheduler import BusScheduler, priority, ESTOP, MOTION
+    from motor_ctrl.velocity_watchdog import VelocityWatchdog
+except ImportError:  # Run as a script from src/motor_ctrl
+    from motion_profile import arrival_times, synchronised_velocities
+    from config import ConfigFile
+    from bus_scheduler import BusScheduler, priority, ESTOP, MOTION
+    from velocity_watchdog import VelocityWatchdog
+
+# Configuration from config_clamp.json next to this file, only read when one of CONFIG_NAMES is first used
+CONFIG = ConfigFile('config_clamp.json', {"MOTOR1_ID": int, "MOTOR2_ID": int, "MOTOR3_ID": int, "MOTOR4_ID": int, "MOTOR5_ID": int, "MOTOR6_ID": int, "BAUDRATE": int, "DEVICENAME": str})
+CONFIG_NAMES = ["MOTOR_IDS", "MOTOR1_ID", "MOTOR2_ID", "MOTOR3_ID", "MOTOR4_ID", "MOTOR5_ID", "MOTOR6_ID", "BAUDRATE", "DEVICENAME"]
+
+# Sets MOTOR_IDS, MOTOR<n>_ID, BAUDRATE and DEVICENAME from the config, parsed again if the file changed
+def load_config():
+    config = CONFIG.load()
+    motor_ids = {f"MOTOR{i}_ID": config[f"MOTOR{i}_ID"] for i in range(1, 7)}
+    globals().update(motor_ids, MOTOR_IDS=motor_ids, BAUDRATE=config['BAUDRATE'], DEVICENAME=config['DEVICENAME'])
+
+# Module attributes not set yet (PEP 562), so importing this module reads no file
+def __getattr__(name):
+    if name in CONFIG_NAMES:
+        load_config()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+# Clamp positions relative to the clamp homes, saved by save_clamp1pos/save_clamp2pos
+CLAMP_POS_SCHEMA = {desc: int for desc in ["home", "max", "rest", "light", "medium", "heavy"]}
+CLAMP1_POS = ConfigFile('clamp1_pos.json', CLAMP_POS_SCHEMA)
+CLAMP2_POS = ConfigFile('clamp2_pos.json', CLAMP_POS_SCHEMA)
 
 # Control table addresses and lengths
 ADDR = {
+    "BAUD_RATE": 8,
+    "RETURN_DELAY_TIME": 9,
     "OPERATING_MODE": 11,
     "CURRENT_LIMIT": 38,
     "TORQUE_ENABLE": 64,
     "LED": 65,
+    "STATUS_RETURN_LEVEL": 68,
+    "HARDWARE_ERROR_STATUS": 70,
     "GOAL_VELOCITY": 104,
     "PROFILE_ACCELERATION": 108,
     "PROFILE_VELOCITY": 112,
@@ -59,29 +72,65 @@ LEN = {
     "PRESENT_TEMPERATURE": 2
 }
 
+# OPERATING_MODE register value and description of each mode
+MODE_SETTINGS = {
+    "pos": (3, "Position"),
+    "extpos": (4, "Extended position"),
+    "curpos": (5, "Current-based position"),
+    "vel": (1, "Velocity"),
+    "pwm": (16, "PWM"),
+    "cur": (0, "Current")
+}
+
 PROTOCOL_VERSION = 2.0  # Protocol version used by the Dynamixel
+ARRIVAL_MARGIN = 0.1  # Polling for arrival starts this long (s) before the predicted arrival
+ARRIVAL_POLL = 0.02  # Interval (s) between arrival polls
+VERIFY_INTERVAL = 50  # With fast writes, every this many writes of a register are read back
+MAX_RETRIES = 2  # Lost packets are resent this many times, each waits the SDK packet timeout
+FAULT_LIMIT = 5  # Failed transactions in a row after which a motor is degraded
+PROBE_INTERVAL = 1.0  # Interval (s) at which partial group reads try degraded motors again
+MAX_REBOOTS = 3  # Reboots to clear hardware errors per motor before it is left degraded
+HARDWARE_ALERT = 0x80  # Alert bit of the status packet error byte
 
 # Class for controlling 6 Dynamixel motors
 # Methods starting with an underscore are helper methods, not meant to be called directly
 class Dynamixel6:
     
-    def __init__(self):
-        self.port_handler = PortHandler(DEVICENAME)
+    # devicename defaults to DEVICENAME of the config, see multi_port.py for motors on several ports
+    def __init__(self, devicename=None):
+        load_config()  # Picks up edits made to the config since the last driver was created
+        self.port_handler = PortHandler(devicename or DEVICENAME)
         self.packet_handler = PacketHandler(PROTOCOL_VERSION)
         self._init_sync_handlers()
         self.motor_pos0 = {motor_id: 0 for motor_id in MOTOR_IDS.values()}
         self.motor_modes = {motor_id: "" for motor_id in MOTOR_IDS.values()}
-        self.lock = threading.Lock()
+        self.lock = BusScheduler()  # Every packet goes through it, see bus_scheduler.py
         self.motor_threads = {motor_id: threading.Thread() for motor_id in MOTOR_IDS.values()}
         self.motor_arrived_events = {motor_id: threading.Event() for motor_id in MOTOR_IDS.values()}
+        self.fast_writes = False  # See set_fast_writes
+        self.write_stats = {"sent": 0, "verified": 0, "mismatched": 0, "failed": 0}
+        self.write_errors = {motor_id: 0 for motor_id in MOTOR_IDS.values()}  # Lost or rejected writes per motor
+        self.write_counts = {}
+        self.sync_read_verify = {}
+        self.health = {}  # See get_health
+        self.faults = {}  # {motor_id: hardware error} of motors held with torque off, see clear_faults
+        self.recovering = set()  # Motors being rebooted by _clear_alert
+        self.fault_lock = threading.Lock()
+        self.velocity_watchdog = VelocityWatchdog(self)  # See set_velocity_timeout and set_velocities_for
         
         self.clamp1_pos0 = 0
         self.clamp2_pos0 = 0
-        with open('src/motor_ctrl/clamp1_pos.json', 'r') as config_file:
-            self.clamp1_pos = json.load(config_file)
-        with open('src/motor_ctrl/clamp2_pos.json', 'r') as config_file:
-            self.clamp2_pos = json.load(config_file)
-        
+
+    # The clamp position files are read on first use and again whenever they change on disk,
+    # positions defined but not saved are lost if that happens
+    @property
+    def clamp1_pos(self):
+        return CLAMP1_POS.load()
+
+    @property
+    def clamp2_pos(self):
+        return CLAMP2_POS.load()
+
     def _init_sync_handlers(self):
         self.sync_read_position = GroupSyncRead(self.port_handler, self.packet_handler, ADDR["PRESENT_POSITION"], LEN["PRESENT_POSITION"])
         self.sync_write_position = GroupSyncWrite(self.port_handler, self.packet_handler, ADDR["GOAL_POSITION"], LEN["GOAL_POSITION"])
@@ -94,6 +143,9 @@ class Dynamixel6:
         self.sync_read_profile_acceleration = GroupSyncRead(self.port_handler, self.packet_handler, ADDR["PROFILE_ACCELERATION"], LEN["PROFILE_ACCELERATION"])
         self.sync_read_profile_velocity = GroupSyncRead(self.port_handler, self.packet_handler, ADDR["PROFILE_VELOCITY"], LEN["PROFILE_VELOCITY"])
         self.sync_read_moving_status = GroupSyncRead(self.port_handler, self.packet_handler, ADDR["MOVING_STATUS"], LEN["MOVING_STATUS"])
+        self.sync_write_torque = GroupSyncWrite(self.port_handler, self.packet_handler, ADDR["TORQUE_ENABLE"], 2)  # TORQUE_ENABLE and LED
+        self.sync_write_mode = GroupSyncWrite(self.port_handler, self.packet_handler, ADDR["OPERATING_MODE"], 1)
+        self.sync_write_status_return = GroupSyncWrite(self.port_handler, self.packet_handler, ADDR["STATUS_RETURN_LEVEL"], 1)
 
     def _check_comm_status(self, comm_result, error, action):
         if comm_result != COMM_SUCCESS:
@@ -101,29 +153,239 @@ class Dynamixel6:
         elif error != 0:
             print(f"{action} error: {self.packet_handler.getRxPacketError(error)}")
 
+    #### Bus Health ####
+
+    def _health(self, motor_id):
+        if motor_id not in self.health:
+            self.health[motor_id] = {"ok": 0, "timeouts": 0, "errors": 0, "retries": 0, "alerts": 0, "reboots": 0,
+                                     "consecutive": 0, "degraded": False, "probed": 0.0}
+        return self.health[motor_id]
+
+    # Counts the outcome of one transaction with a motor, returns True if its status packet came back
+    # A motor that fails FAULT_LIMIT times in a row is degraded until it answers again
+    def _record(self, motor_id, comm_result, error):
+        health = self._health(motor_id)
+        if error & HARDWARE_ALERT:
+            health["alerts"] += 1
+        if comm_result == COMM_SUCCESS:
+            health["ok"] += 1
+            health["consecutive"] = 0
+            if health["degraded"]:
+                health["degraded"] = False
+                print(f"ID {motor_id} answering again")
+            return True
+        health["timeouts" if comm_result == COMM_RX_TIMEOUT else "errors"] += 1
+        health["consecutive"] += 1
+        if health["consecutive"] >= FAULT_LIMIT and not health["degraded"]:
+            health["degraded"] = True
+            print(f"ID {motor_id} degraded after {health['consecutive']} failed transactions")
+        return False
+
+    # Runs transaction() -> (..., comm_result, error) with one motor, resent up to MAX_RETRIES times while the
+    # packet is lost (once for a degraded motor); returns the values before comm_result, e.g. the data of a read
+    def _transact(self, motor_id, action, transaction):
+        attempts = 1 if self._health(motor_id)["degraded"] else MAX_RETRIES + 1
+        for attempt in range(attempts):
+            if attempt:
+                self.health[motor_id]["retries"] += 1
+            with self.lock:
+                *values, comm_result, error = transaction()
+            if self._record(motor_id, comm_result, error):
+                break
+        self._check_comm_status(comm_result, error, action)
+        if comm_result == COMM_SUCCESS and error & HARDWARE_ALERT:
+            self._queue_alert(motor_id)
+        return values
+
+    # Alerts are cleared on a thread of their own, so the 0.5 s of a reboot never stalls the telemetry
+    # poll or command that saw the alert; one recovery per motor at a time
+    def _queue_alert(self, motor_id):
+        with self.fault_lock:
+            if motor_id in self.recovering:
+                return
+            self.recovering.add(motor_id)
+        threading.Thread(target=self._clear_alert, args=(motor_id,), name=f"alert-{motor_id}", daemon=True).start()
+
+    # The alert bit means the motor has shut its torque off on a hardware error (overload, overheating,
+    # input voltage...); the motor is rebooted to clear it, up to MAX_REBOOTS times, but its torque is left
+    # off and it is listed in faults until clear_faults, so a motor that overloaded is never driven unattended
+    def _clear_alert(self, motor_id):
+        try:
+            health = self._health(motor_id)
+            with self.lock:
+                status, comm_result, _ = self.packet_handler.read1ByteTxRx(self.port_handler, motor_id, ADDR["HARDWARE_ERROR_STATUS"])
+            self.faults[motor_id] = f"hardware error status {status:#010b}" if comm_result == COMM_SUCCESS else "hardware alert"
+            print(f"ID {motor_id} {self.faults[motor_id]}, torque off until clear_faults")
+            if health["reboots"] >= MAX_REBOOTS:
+                if not health["degraded"]:
+                    health["degraded"] = True
+                    print(f"ID {motor_id} degraded, hardware error persists after {MAX_REBOOTS} reboots")
+                return
+            health["reboots"] += 1
+            self.reboot(motor_id)
+        except (RuntimeError, IOError) as e:
+            print(f"Clearing the alert of ID {motor_id} failed: {e}")
+        finally:
+            with self.fault_lock:
+                self.recovering.discard(motor_id)
+
+    # Motors of motor_ids a partial group read should ask, degraded ones only every PROBE_INTERVAL
+    def _live_ids(self, motor_ids):
+        now = time.monotonic()
+        live = []
+        for motor_id in motor_ids:
+            health = self._health(motor_id)
+            if health["degraded"] and now - health["probed"] < PROBE_INTERVAL:
+                continue
+            if health["degraded"]:
+                health["probed"] = now
+            live.append(motor_id)
+        return live
+
+    # Returns {motor_id: counters} of every motor talked to: transactions that were ok, timed out or failed
+    # otherwise, packets resent, hardware alerts seen, reboots to clear them, whether it is degraded and
+    # its fault (see get_faults), None if it has none
+    def get_health(self):
+        return {motor_id: {**{key: value for key, value in health.items() if key != "probed"}, "fault": self.faults.get(motor_id)}
+                for motor_id, health in self.health.items()}
+
+    # Counters only, faults stay until clear_faults
+    def reset_health(self):
+        self.health = {}
+
+    # Returns {motor_id: hardware error} of the motors whose torque is held off after a hardware alert
+    def get_faults(self):
+        return dict(self.faults)
+
+    def _pop_faults(self, motor_ids):
+        motor_ids = list(self.faults) if motor_ids is None else [motor_id for motor_id in motor_ids if motor_id in self.faults]
+        for motor_id in motor_ids:
+            self.faults.pop(motor_id, None)
+        return motor_ids
+
+    # Enables the torque of faulted motors (all by default) again once the cause is dealt with, the only way
+    # a motor is driven again after a hardware alert; returns the IDs that were faulted
+    def clear_faults(self, motor_ids=None):
+        motor_ids = self._pop_faults(motor_ids)
+        if motor_ids:
+            self.enable_torques(motor_ids)
+            print(f"IDs {motor_ids} faults cleared")
+        return motor_ids
+
+    # motor_ids without the faulted motors, which keep their torque off
+    def _unfaulted(self, motor_ids):
+        faults = self.get_faults()
+        held = [motor_id for motor_id in motor_ids if motor_id in faults]
+        if held:
+            print(f"IDs {held} faulted ({', '.join(faults[motor_id] for motor_id in held)}), torque left off until clear_faults")
+        return [motor_id for motor_id in motor_ids if motor_id not in faults]
+
     def _write_register(self, motor_id, address, value):
-        with self.lock:
-            comm_result, error = self.packet_handler.write1ByteTxRx(self.port_handler, motor_id, address, value)
-        self._check_comm_status(comm_result, error, f"Writing to register {address} for ID {motor_id}")
+        if self.fast_writes:
+            self._write_fast(motor_id, address, value, 1)
+            return
+        self._transact(motor_id, f"Writing to register {address} for ID {motor_id}",
+                       lambda: self.packet_handler.write1ByteTxRx(self.port_handler, motor_id, address, value))
 
     def _write_data(self, motor_id, address, data, length, description):
         data = int(data)
+        if self.fast_writes:
+            self._write_fast(motor_id, address, data, length)
+            return
         write_method = {1: self.packet_handler.write1ByteTxRx, 
                         2: self.packet_handler.write2ByteTxRx, 
                         4: self.packet_handler.write4ByteTxRx}[length]
-        comm_result, error = write_method(self.port_handler, motor_id, address, data)
-        self._check_comm_status(comm_result, error, f"Setting {description} for ID {motor_id}")
+        self._transact(motor_id, f"Setting {description} for ID {motor_id}",
+                       lambda: write_method(self.port_handler, motor_id, address, data))
     
     def _read_sync_data(self, sync_read, motor_id, address, length):
+        return self._read_sync_group(sync_read, [motor_id], address, length)[motor_id]
+
+    # Sends a write without waiting for a status packet
+    def _write_fast(self, motor_id, address, data, length):
+        write_method = {1: self.packet_handler.write1ByteTxOnly,
+                        2: self.packet_handler.write2ByteTxOnly,
+                        4: self.packet_handler.write4ByteTxOnly}[length]
         with self.lock:
-            sync_read.clearParam()
-            if not sync_read.addParam(motor_id):
-                raise RuntimeError(f"GroupSyncRead addparam failed for ID {motor_id}")
-            comm_result = sync_read.txRxPacket()
-        self._check_comm_status(comm_result, 0, f"Reading data from address {address} for ID {motor_id}")
-        if not sync_read.isAvailable(motor_id, address, length):
-            raise RuntimeError(f"GroupSyncRead getdata failed for ID {motor_id}")
-        data = sync_read.getData(motor_id, address, length)
+            comm_result = write_method(self.port_handler, motor_id, address, data)
+        self._check_comm_status(comm_result, 0, f"Sending to address {address} for ID {motor_id}")
+        self._count_writes(address, length, {motor_id: data})
+
+    # Counts writes {motor_id: value} of address that got no status packet; with fast writes every
+    # VERIFY_INTERVAL-th one is read back, lost or rejected writes are counted in write_stats and write_errors
+    def _count_writes(self, address, length, values):
+        self.write_stats["sent"] += len(values)
+        self.write_counts[address] = self.write_counts.get(address, 0) + 1
+        if not self.fast_writes or self.write_counts[address] % VERIFY_INTERVAL:
+            return
+        if address not in self.sync_read_verify:
+            self.sync_read_verify[address] = GroupSyncRead(self.port_handler, self.packet_handler, address, length)
+        try:
+            present = self._read_sync_group(self.sync_read_verify[address], list(values), address, length)
+        except RuntimeError as e:
+            self.write_stats["failed"] += 1
+            print(f"Write verification failed: {e}")
+            return
+        self.write_stats["verified"] += len(values)
+        for motor_id, value in values.items():
+            if present[motor_id] != int(value):
+                self.write_stats["mismatched"] += 1
+                self.write_errors[motor_id] += 1
+                print(f"ID {motor_id} reads {present[motor_id]} at address {address}, {int(value)} was written")
+
+    # Takes the status packets of a sync read in whatever order they come until every motor of motor_ids
+    # has answered or the packet timeout runs out; a missing motor does not lose the replies after it
+    # Returns {motor_id: (data, error)} and the result of the last receive
+    def _receive_statuses(self, motor_ids, length):
+        replies = {}
+        result = COMM_SUCCESS
+        while len(replies) < len(motor_ids):
+            rxpacket, result = self.packet_handler.rxPacket(self.port_handler, False)
+            if result != COMM_SUCCESS:
+                break
+            if rxpacket[PKT_ID] in motor_ids:
+                replies[rxpacket[PKT_ID]] = (rxpacket[PKT_PARAMETER0 + 1:PKT_PARAMETER0 + 1 + length], rxpacket[PKT_ERROR])
+        return replies, result
+
+    # Reads the same address from several motors in a single sync read packet
+    # Every motor's status packet is taken on its own, so the motors that did not answer are asked
+    # again (up to MAX_RETRIES times, degraded ones are not) without losing the replies of the others
+    # With partial, degraded motors are only tried every PROBE_INTERVAL and the motors that still did not
+    # answer are left out of the result, so one bad motor does not stop the rest of the bus being read;
+    # otherwise, or if no motor answered at all, a missing reply raises RuntimeError
+    def _read_sync_group(self, sync_read, motor_ids, address, length, partial=False):
+        motor_ids = list(MOTOR_IDS.values()) if motor_ids is None else list(motor_ids)
+        asked = self._live_ids(motor_ids) if partial else motor_ids
+        pending = asked
+        data = {}
+        alerts = []
+        for attempt in range(MAX_RETRIES + 1):
+            with self.lock:
+                sync_read.clearParam()
+                for motor_id in pending:
+                    if not sync_read.addParam(motor_id):
+                        raise RuntimeError(f"GroupSyncRead addparam failed for ID {motor_id}")
+                comm_result = sync_read.txPacket()
+                replies, comm_result = self._receive_statuses(pending, length) if comm_result == COMM_SUCCESS else ({}, comm_result)
+            for motor_id in pending:
+                if attempt:
+                    self.health[motor_id]["retries"] += 1
+                values, error = replies.get(motor_id, ([], 0))
+                if self._record(motor_id, COMM_SUCCESS if motor_id in replies else comm_result, error):
+                    data[motor_id] = self._to_signed(int.from_bytes(bytes(values), "little"), length)
+                    if error & HARDWARE_ALERT:
+                        alerts.append(motor_id)
+            pending = [motor_id for motor_id in pending if motor_id not in data and not self.health[motor_id]["degraded"]]
+            if not pending:
+                break
+        for motor_id in alerts:
+            self._queue_alert(motor_id)
+        missing = [motor_id for motor_id in asked if motor_id not in data]
+        if missing and (not partial or len(missing) == len(asked)):
+            raise RuntimeError(f"GroupSyncRead getdata failed for IDs {missing} at address {address}")
+        return data
+
+    def _to_signed(self, data, length):
         if length == 2 and data > 32768:
             data -= 65536
         elif length == 4 and data > 2147483648:
@@ -149,9 +411,12 @@ class Dynamixel6:
     def reboot(self, motor_id):
         with self.lock:
             comm_result, error = self.packet_handler.reboot(self.port_handler, motor_id)
+        self._record(motor_id, comm_result, error & ~HARDWARE_ALERT)
         self._check_comm_status(comm_result, error, f"Rebooting motor ID {motor_id}")
         time.sleep(0.5)
         print(f"ID {motor_id} rebooted")
+        if self.fast_writes:
+            self._set_status_return_level([motor_id], 1)  # Back to the default after a reboot
 
     #### Torque & Modes ####
 
@@ -159,8 +424,10 @@ class Dynamixel6:
         value = 1 if enable else 0
         self._write_register(motor_id, ADDR["TORQUE_ENABLE"], value)
 
-    # Enables torque
+    # Enables torque, unless the motor is faulted (see clear_faults)
     def enable_torque(self, motor_id):
+        if not self._unfaulted([motor_id]):
+            return
         self._set_torque(motor_id, True)
         self.turn_LED_on(motor_id)
         print(f"ID {motor_id} torque enabled")
@@ -170,6 +437,51 @@ class Dynamixel6:
         self._set_torque(motor_id, False)
         self.turn_LED_off(motor_id)
         print(f"ID {motor_id} torque disabled")
+
+    # Writes TORQUE_ENABLE and LED, which are adjacent, of several motors in one sync write packet
+    def _set_torques(self, motor_ids, enable):
+        value = 1 if enable else 0
+        motor_ids = list(motor_ids)
+        with self.lock:
+            self.sync_write_torque.clearParam()
+            for motor_id in motor_ids:
+                if not self.sync_write_torque.addParam(motor_id, [value, value]):
+                    raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_torque.txPacket()
+        self._check_comm_status(comm_result, 0, f"Writing torque for IDs {motor_ids}")
+
+    # Enables torque and turns the LEDs on for several motors (all by default) in one packet, faulted ones excepted
+    def enable_torques(self, motor_ids=None):
+        motor_ids = self._unfaulted(list(MOTOR_IDS.values()) if motor_ids is None else list(motor_ids))
+        if not motor_ids:
+            return
+        self._set_torques(motor_ids, True)
+        print(f"IDs {motor_ids} torque enabled")
+
+    # Disables torque and turns the LEDs off for several motors (all by default) in one packet
+    def disable_torques(self, motor_ids=None):
+        motor_ids = list(MOTOR_IDS.values()) if motor_ids is None else list(motor_ids)
+        self._set_torques(motor_ids, False)
+        print(f"IDs {motor_ids} torque disabled")
+
+    # Sync write, so no motor replies whatever its current level
+    def _set_status_return_level(self, motor_ids, level):
+        with self.lock:
+            self.sync_write_status_return.clearParam()
+            for motor_id in motor_ids:
+                if not self.sync_write_status_return.addParam(motor_id, [level]):
+                    raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_status_return.txPacket()
+        self._check_comm_status(comm_result, 0, f"Writing status return level for IDs {list(motor_ids)}")
+
+    # Low-latency writes for streaming: with enable the motors only send status packets for reads
+    # (STATUS_RETURN_LEVEL 1) and every write goes out with writeTxOnly or a sync write, never waiting
+    # for a reply; every VERIFY_INTERVAL-th write of a register is read back so faults are still seen
+    def set_fast_writes(self, enable, motor_ids=None):
+        motor_ids = list(MOTOR_IDS.values()) if motor_ids is None else list(motor_ids)
+        self._set_status_return_level(motor_ids, 1 if enable else 2)
+        self.fast_writes = enable
+        print(f"IDs {motor_ids} fast writes {'enabled' if enable else 'disabled'}")
     
     # Reads current limit (1 = 1 mA)
     def get_current_limit(self, motor_id):
@@ -179,32 +491,38 @@ class Dynamixel6:
     def set_current_limit(self, motor_id, current):
         current = int(current)
         self.disable_torque(motor_id)  # Torque must be disabled to change current limit
-        comm_result, error = self.packet_handler.write2ByteTxRx(self.port_handler, motor_id, ADDR["CURRENT_LIMIT"], current)
-        self._check_comm_status(comm_result, error, f"Setting current limit for ID {motor_id}")
+        self._write_data(motor_id, ADDR["CURRENT_LIMIT"], current, 2, "current limit")
         self.reboot(motor_id)  # Reboot required for current limit to take effect
         self.enable_torque(motor_id)  # Re-enable torque after reboot
 
     # Sets mode
     def set_mode(self, motor_id, mode):
-        if self.motor_modes[motor_id] == mode:
+        self.set_modes({motor_id: mode})
+
+    # Sets the modes of several motors {motor_id: mode} in three sync write packets in total:
+    # torque off, OPERATING_MODE, torque on; motors already in their mode are left alone and faulted
+    # motors keep their torque off (see clear_faults)
+    def set_modes(self, modes):
+        for mode in modes.values():
+            if mode not in MODE_SETTINGS:
+                raise ValueError("Invalid mode")
+        changes = {motor_id: mode for motor_id, mode in modes.items() if self.motor_modes[motor_id] != mode}
+        if not changes:
             return
-        self.disable_torque(motor_id)  # Torque must be disabled to change mode
-        mode_settings = {
-            "pos": (3, "Position"),
-            "extpos": (4, "Extended position"),
-            "curpos": (5, "Current-based position"),
-            "vel": (1, "Velocity"),
-            "pwm": (16, "PWM"),
-            "cur": (0, "Current")
-        }
-        if mode in mode_settings:
-            register_value, mode_description = mode_settings[mode]
-            self._write_register(motor_id, ADDR["OPERATING_MODE"], register_value)
-            print(f"ID {motor_id} set to {mode_description} mode")
+        self._set_torques(changes, False)  # Torque must be disabled to change mode
+        with self.lock:
+            self.sync_write_mode.clearParam()
+            for motor_id, mode in changes.items():
+                if not self.sync_write_mode.addParam(motor_id, [MODE_SETTINGS[mode][0]]):
+                    raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_mode.txPacket()
+        self._check_comm_status(comm_result, 0, f"Writing modes for IDs {list(changes)}")
+        for motor_id, mode in changes.items():
             self.motor_modes[motor_id] = mode
-        else:
-            raise ValueError("Invalid mode")
-        self.enable_torque(motor_id)  # Re-enable torque after changing mode
+            print(f"ID {motor_id} set to {MODE_SETTINGS[mode][1]} mode")
+        enable = self._unfaulted(list(changes))
+        if enable:
+            self._set_torques(enable, True)  # Re-enable torque after changing mode
 
     #### LED ####
 
@@ -228,6 +546,33 @@ class Dynamixel6:
     
     def get_temperature(self, motor_id):
         return self._read_sync_data(self.sync_read_temperature, motor_id, ADDR["PRESENT_TEMPERATURE"], LEN["PRESENT_TEMPERATURE"])
+
+    # Group reads return {motor_id: value} for all motors (or the given IDs) in one packet
+    # With partial, motors that do not answer are left out instead of failing the read (see _read_sync_group)
+
+    def get_positions(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_position, motor_ids, ADDR["PRESENT_POSITION"], LEN["PRESENT_POSITION"], partial)
+
+    def get_velocities(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_velocity, motor_ids, ADDR["PRESENT_VELOCITY"], LEN["PRESENT_VELOCITY"], partial)
+
+    def get_currents(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_current, motor_ids, ADDR["PRESENT_CURRENT"], LEN["PRESENT_CURRENT"], partial)
+
+    def get_voltages(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_voltage, motor_ids, ADDR["PRESENT_INPUT_VOLTAGE"], LEN["PRESENT_INPUT_VOLTAGE"], partial)
+
+    def get_temperatures(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_temperature, motor_ids, ADDR["PRESENT_TEMPERATURE"], LEN["PRESENT_TEMPERATURE"], partial)
+
+    def get_moving_statuses(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_moving_status, motor_ids, ADDR["MOVING_STATUS"], LEN["MOVING_STATUS"], partial)
+
+    def get_profile_accelerations(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_profile_acceleration, motor_ids, ADDR["PROFILE_ACCELERATION"], LEN["PROFILE_ACCELERATION"], partial)
+
+    def get_profile_velocities(self, motor_ids=None, partial=False):
+        return self._read_sync_group(self.sync_read_profile_velocity, motor_ids, ADDR["PROFILE_VELOCITY"], LEN["PROFILE_VELOCITY"], partial)
     
     #### Moving Monitoring ####
     
@@ -238,12 +583,28 @@ class Dynamixel6:
         return self.get_moving_status(motor_id) & 0b01
     
     def _wait_for_motor(self, motor_id):
-        while not self.motor_arrived_events[motor_id].is_set():
-            time.sleep(0.1)
-            self.motor1_arrived = self.has_arrived(motor_id)
-            if self.motor1_arrived:
-                self.motor_arrived_events[motor_id].set()
-                print(f"ID {motor_id} has arrived")
+        with priority(MOTION):
+            while not self.motor_arrived_events[motor_id].is_set():
+                time.sleep(0.1)
+                self.motor1_arrived = self.has_arrived(motor_id)
+                if self.motor1_arrived:
+                    self.motor_arrived_events[motor_id].set()
+                    print(f"ID {motor_id} has arrived")
+
+    # Sleeps until shortly before the predicted arrival (s from now), then polls the moving status
+    # of all the motors in one group read until every one of them has arrived
+    def _wait_for_motors(self, motor_ids, eta):
+        with priority(MOTION):
+            remaining = set(motor_ids)
+            time.sleep(max(eta - ARRIVAL_MARGIN, ARRIVAL_POLL))
+            while remaining:
+                for motor_id, status in self.get_moving_statuses(remaining).items():
+                    if status & 0b01:
+                        remaining.discard(motor_id)
+                        self.motor_arrived_events[motor_id].set()
+                        print(f"ID {motor_id} has arrived")
+                if remaining:
+                    time.sleep(ARRIVAL_POLL)
     
     #### Profile ####
 
@@ -263,10 +624,11 @@ class Dynamixel6:
 
     def _write_position(self, motor_id, position):
         position_byte = [DXL_LOBYTE(DXL_LOWORD(position)), DXL_HIBYTE(DXL_LOWORD(position)), DXL_LOBYTE(DXL_HIWORD(position)), DXL_HIBYTE(DXL_HIWORD(position))]
-        self.sync_write_position.clearParam()
-        if not self.sync_write_position.addParam(motor_id, position_byte):
-            raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
-        comm_result = self.sync_write_position.txPacket()
+        with self.lock:
+            self.sync_write_position.clearParam()
+            if not self.sync_write_position.addParam(motor_id, position_byte):
+                raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_position.txPacket()
         self._check_comm_status(comm_result, 0, f"Writing position for ID {motor_id}")
 
     # Returns the current position of the motor
@@ -280,6 +642,44 @@ class Dynamixel6:
         self.set_mode(motor_id, mode)
         self.set_profile_velocity(motor_id, vel)
         self._write_position(motor_id, position)
+
+    # Sets the positions of several motors {motor_id: position} in one sync write packet,
+    # uses the profile velocity already set and does not wait for the motors to reach the positions
+    def set_positions(self, positions, mode="extpos"):
+        if mode not in ["extpos", "curpos"]:
+            raise ValueError("Invalid mode")
+        self.set_modes({motor_id: mode for motor_id in positions})
+        with self.lock:
+            self.sync_write_position.clearParam()
+            for motor_id, position in positions.items():
+                position = int(position)
+                position_byte = [DXL_LOBYTE(DXL_LOWORD(position)), DXL_HIBYTE(DXL_LOWORD(position)), DXL_LOBYTE(DXL_HIWORD(position)), DXL_HIBYTE(DXL_HIWORD(position))]
+                if not self.sync_write_position.addParam(motor_id, position_byte):
+                    raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_position.txPacket()
+        self._check_comm_status(comm_result, 0, f"Writing positions for IDs {list(positions)}")
+        self._count_writes(ADDR["GOAL_POSITION"], LEN["GOAL_POSITION"], positions)
+
+    # Moves several motors {motor_id: position} with one sync write and waits until all of them have arrived
+    # With sync, each motor gets a profile velocity (at most vel) that makes them all arrive together,
+    # vel=None keeps the profile velocities already set
+    def _goto_positions(self, positions, vel=None, mode="extpos", sync=True):
+        motor_ids = list(positions)
+        present = self.get_positions(motor_ids)
+        acc = self.get_profile_accelerations(motor_ids)
+        distance = np.array([positions[motor_id] - present[motor_id] for motor_id in motor_ids])
+        acc = np.array([acc[motor_id] for motor_id in motor_ids])
+        keep_vel = vel is None
+        if keep_vel:
+            vel = self.get_profile_velocities(motor_ids)
+            vel = np.array([vel[motor_id] for motor_id in motor_ids])
+        vels = synchronised_velocities(distance, vel, acc) if sync else np.broadcast_to(vel, distance.shape)
+        for motor_id, motor_vel in zip(motor_ids, vels):  # set_positions sets the modes in one go
+            if sync or not keep_vel:
+                self.set_profile_velocity(motor_id, int(motor_vel))
+            self.motor_arrived_events[motor_id].clear()
+        self.set_positions(positions, mode)
+        self._wait_for_motors(motor_ids, arrival_times(distance, vels, acc).max(initial=0))
     
     # Defines the current position as the new position 0
     def define_position0(self, motor_id):
@@ -300,26 +700,13 @@ class Dynamixel6:
         self.motor_threads[motor_id].join()
     
     # Moves the motors to the specified positions and waits for all motors to reach their positions
-    def goto_quadpos(self, pos1, pos2, pos3, pos4, vel, mode="extpos"):
-        for motor_id, pos in zip(MOTOR_IDS.values(), [pos1, pos2, pos3, pos4]):
-            self.set_position(motor_id, pos, vel, mode)
-        for motor_id in MOTOR_IDS.values():
-            self.motor_arrived_events[motor_id].clear()
-            self.motor_threads[motor_id] = threading.Thread(target=self._wait_for_motor, args=(motor_id,))
-            self.motor_threads[motor_id].start()
-        for motor_id in MOTOR_IDS.values():
-            self.motor_threads[motor_id].join()
+    # With sync, the profile velocities are scaled so all motors arrive at the same time
+    def goto_quadpos(self, pos1, pos2, pos3, pos4, vel, mode="extpos", sync=True):
+        self._goto_positions(dict(zip(MOTOR_IDS.values(), [pos1, pos2, pos3, pos4])), vel, mode, sync)
     
     # Moves the clamps to the specified positions and waits for all motors to reach their positions
     def _goto_clamppos(self, pos5, pos6, vel, mode="extpos"):
-        for motor_id, pos in zip([MOTOR5_ID, MOTOR6_ID], [pos5, pos6]):
-            self.set_position(motor_id, pos, vel, mode)
-        for motor_id in [MOTOR5_ID, MOTOR6_ID]:
-            self.motor_arrived_events[motor_id].clear()
-            self.motor_threads[motor_id] = threading.Thread(target=self._wait_for_motor, args=(motor_id,))
-            self.motor_threads[motor_id].start()
-        for motor_id in [MOTOR5_ID, MOTOR6_ID]:
-            self.motor_threads[motor_id].join()
+        self._goto_positions({MOTOR5_ID: pos5, MOTOR6_ID: pos6}, vel, mode, sync=False)
 
     #### Velocity Control ####
 
@@ -331,56 +718,52 @@ class Dynamixel6:
     def set_velocity(self, motor_id, velocity):
         self.set_mode(motor_id, "vel")
         self._write_data(motor_id, ADDR["GOAL_VELOCITY"], velocity, 4, "velocity")
+        self.velocity_watchdog.touch({motor_id: velocity})
+
+    # Sets the velocities of several motors {motor_id: velocity} in one sync write packet
+    def set_velocities(self, velocities):
+        self.set_modes({motor_id: "vel" for motor_id in velocities})
+        with self.lock:
+            self.sync_write_velocity.clearParam()
+            for motor_id, velocity in velocities.items():
+                velocity = int(velocity)
+                velocity_byte = [DXL_LOBYTE(DXL_LOWORD(velocity)), DXL_HIBYTE(DXL_LOWORD(velocity)), DXL_LOBYTE(DXL_HIWORD(velocity)), DXL_HIBYTE(DXL_HIWORD(velocity))]
+                if not self.sync_write_velocity.addParam(motor_id, velocity_byte):
+                    raise RuntimeError(f"GroupSyncWrite addparam failed for ID {motor_id}")
+            comm_result = self.sync_write_velocity.txPacket()
+        self._check_comm_status(comm_result, 0, f"Writing velocities for IDs {list(velocities)}")
+        self._count_writes(ADDR["GOAL_VELOCITY"], LEN["GOAL_VELOCITY"], velocities)
+        self.velocity_watchdog.touch(velocities)
+
+    # Stops a motor left moving without a new velocity command for timeout (s), None turns it off (default)
+    def set_velocity_timeout(self, timeout):
+        self.velocity_watchdog.set_timeout(timeout)
+
+    # Sets the velocities {motor_id: velocity} for dur (s) and returns at once, the stop is scheduled on
+    # the timer wheel (see velocity_watchdog.py); returns a threading.Event set when the move is over
+    def set_velocities_for(self, velocities, dur, brake=True):
+        return self.velocity_watchdog.run_for(velocities, dur, brake)
             
     #### Higher Level ####
 
-    def set_dualvel(self, vel1, vel2, dur, brake=True):
-        BUFF = 0.2
-        if dur < BUFF:
-            print(f"Duration must be greater than {BUFF}s")
-            self.stop_motors()
-            return
-        self.set_velocity(MOTOR1_ID, vel1)
-        self.set_velocity(MOTOR2_ID, vel2)
-        time.sleep(dur - BUFF)
-        if brake:
-            self.stop_motors()
-        else:
-            self.disable_torque(MOTOR1_ID)
-            self.disable_torque(MOTOR2_ID)
-            time.sleep(BUFF)
-            self.enable_torque(MOTOR1_ID)
-            self.enable_torque(MOTOR2_ID)
-
-    def set_quadvel(self, vel1, vel2, vel3, vel4, dur, brake=True):
-        BUFF = 0.2
-        if dur < BUFF:
-            print(f"Duration must be greater than {BUFF}s")
-            self.stop_motors()
-            return
-        self.set_velocity(MOTOR1_ID, vel1)
-        self.set_velocity(MOTOR2_ID, vel2)
-        self.set_velocity(MOTOR3_ID, vel3)
-        self.set_velocity(MOTOR4_ID, vel4)
-        time.sleep(dur - BUFF)
-        if brake:
-            self.stop_motors()
-        else:
-            self.disable_torque(MOTOR1_ID)
-            self.disable_torque(MOTOR2_ID)
-            self.disable_torque(MOTOR3_ID)
-            self.disable_torque(MOTOR4_ID)
-            time.sleep(BUFF)
-            self.enable_torque(MOTOR1_ID)
-            self.enable_torque(MOTOR2_ID)
-            self.enable_torque(MOTOR3_ID)
-            self.enable_torque(MOTOR4_ID)
+    # Runs motors 1 and 2 at vel1 and vel2 for dur (s), waits for the end of the move unless wait is False
+    def set_dualvel(self, vel1, vel2, dur, brake=True, wait=True):
+        done = self.set_velocities_for({MOTOR1_ID: vel1, MOTOR2_ID: vel2}, dur, brake)
+        if wait:
+            done.wait()
+        return done
+
+    # Runs motors 1 to 4 for dur (s), waits for the end of the move unless wait is False
+    def set_quadvel(self, vel1, vel2, vel3, vel4, dur, brake=True, wait=True):
+        done = self.set_velocities_for({MOTOR1_ID: vel1, MOTOR2_ID: vel2, MOTOR3_ID: vel3, MOTOR4_ID: vel4}, dur, brake)
+        if wait:
+            done.wait()
+        return done
     
+    # Emergency stop, one sync write that goes ahead of any other traffic waiting for the bus
     def stop_motors(self):
-        self.set_velocity(MOTOR1_ID, 0)
-        self.set_velocity(MOTOR2_ID, 0)
-        self.set_velocity(MOTOR3_ID, 0)
-        self.set_velocity(MOTOR4_ID, 0)
+        with priority(ESTOP):
+            self.set_velocities({MOTOR1_ID: 0, MOTOR2_ID: 0, MOTOR3_ID: 0, MOTOR4_ID: 0})
         
     #### Clamp Settings ####
     
@@ -419,14 +802,12 @@ class Dynamixel6:
         self.clamp2_pos["heavy"] = self.get_position(MOTOR6_ID) - self.clamp2_pos0
         
     def save_clamp1pos(self):
-        with open('src/motor_ctrl/clamp1_pos.json', 'w') as config_file:
-            json.dump(self.clamp1_pos, config_file, indent=2)
-            print("Clamp1 positions saved")
+        CLAMP1_POS.save(self.clamp1_pos)
+        print("Clamp1 positions saved")
             
     def save_clamp2pos(self):
-        with open('src/motor_ctrl/clamp2_pos.json', 'w') as config_file:
-            json.dump(self.clamp2_pos, config_file, indent=2)
-            print("Clamp2 positions saved")
+        CLAMP2_POS.save(self.clamp2_pos)
+        print("Clamp2 positions saved")
         
     #### Clamp Control ####
         
@@ -509,12 +890,7 @@ if __name__ == "__main__":
     dnx = Dynamixel6()
     try:
         dnx.open_port()
-        dnx.enable_torque(MOTOR1_ID)
-        dnx.enable_torque(MOTOR2_ID)
-        dnx.enable_torque(MOTOR3_ID)
-        dnx.enable_torque(MOTOR4_ID)
-        dnx.enable_torque(MOTOR5_ID)
-        dnx.enable_torque(MOTOR6_ID)
+        dnx.enable_torques([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID, MOTOR5_ID, MOTOR6_ID])
         
         dnx.define_quadpos0()
         dnx.define_homeclamp1()
@@ -587,12 +963,7 @@ if __name__ == "__main__":
 
         
     finally:
-        dnx.disable_torque(MOTOR1_ID)
-        dnx.disable_torque(MOTOR2_ID)
-        dnx.disable_torque(MOTOR3_ID)
-        dnx.disable_torque(MOTOR4_ID)
-        dnx.disable_torque(MOTOR5_ID)
-        dnx.disable_torque(MOTOR6_ID)
+        dnx.disable_torques([MOTOR1_ID, MOTOR2_ID, MOTOR3_ID, MOTOR4_ID, MOTOR5_ID, MOTOR6_ID])
         for motor_id in MOTOR_IDS.values():
             if dnx.motor_threads[motor_id].is_alive():
                 dnx.motor_arrived_events[motor_id].set()
@@ -0,0 +1,82 @@
+import threading
+import time
+
+from PyQt5.QtCore import QThread, pyqtSignal
+try:
+    from motor_ctrl.bus_scheduler import priority, TELEMETRY
+except ImportError:  # Run as a script from src/motor_ctrl
+    from bus_scheduler import priority, TELEMETRY
+
+# Snapshot fields and the group read used to fill each of them
+TELEMETRY_READERS = {
+    "position": "get_positions",
+    "velocity": "get_velocities",
+    "current": "get_currents",
+    "voltage": "get_voltages",
+    "temperature": "get_temperatures"
+}
+
+# Background thread that polls motor state at its own rate into a shared snapshot
+# Works with any of the Dynamixel* classes; the GUI only renders the latest snapshot,
+# so a slow or timed-out packet never blocks the Qt event loop
+class TelemetryThread(QThread):
+
+    updated = pyqtSignal(dict)
+    faulted = pyqtSignal(dict)  # {motor_id: hardware error} of the driver's faulted motors, when they change
+
+    def __init__(self, dnx, motor_ids, rate=20, fields=tuple(TELEMETRY_READERS)):
+        super().__init__()
+        self.dnx = dnx
+        self.motor_ids = list(motor_ids)
+        self.fields = fields
+        self.period = 1 / rate
+        self.snapshot = {}
+        self.faults = {}
+        self.running = True
+        self.lock = threading.Lock()
+
+    # Changes the poll rate (Hz), takes effect from the next tick
+    def set_rate(self, rate):
+        self.period = 1 / rate
+
+    # Returns the latest snapshot: {"time": t, field: {motor_id: value}}
+    def latest(self):
+        with self.lock:
+            return self.snapshot
+
+    # Partial reads: a motor that does not answer is missing from the snapshot instead of failing the tick
+    def poll(self):
+        snapshot = {"time": time.monotonic()}
+        for field in self.fields:
+            snapshot[field] = getattr(self.dnx, TELEMETRY_READERS[field])(self.motor_ids, partial=True)
+        return snapshot
+
+    # Polls in the TELEMETRY class, so the reads give way to commands and motion waits on the bus
+    def run(self):
+        with priority(TELEMETRY):
+            self._poll_loop()
+
+    def _poll_loop(self):
+        next_tick = time.monotonic()
+        while self.running:
+            try:
+                snapshot = self.poll()
+                faults = self.dnx.get_faults()
+            except RuntimeError as e:
+                print(f"Telemetry poll failed: {e}")
+            else:
+                with self.lock:
+                    self.snapshot = snapshot
+                self.updated.emit(snapshot)
+                if faults != self.faults:
+                    self.faults = faults
+                    self.faulted.emit(faults)
+            next_tick += self.period
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_tick = time.monotonic()  # Overran, don't try to catch up
+
+    def stop(self):
+        self.running = False
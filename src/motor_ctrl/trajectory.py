@@ -0,0 +1,100 @@
+import time
+
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
+
+# Multi-motor trajectory: sample times (s, increasing, starting at 0) and one column of positions per motor
+class Trajectory:
+
+    def __init__(self, motor_ids, times, positions):
+        self.motor_ids = list(motor_ids)
+        self.times = np.asarray(times, dtype=float)
+        self.positions = np.asarray(positions, dtype=float).reshape(len(self.times), len(self.motor_ids))
+        if self.times.ndim != 1 or len(self.times) < 2:
+            raise ValueError("Trajectory needs at least 2 samples")
+        if np.any(np.diff(self.times) <= 0):
+            raise ValueError("Trajectory times must be increasing")
+
+    # Builds a trajectory through waypoints [{motor_id: position}, ...] reached after the given durations (s)
+    # The first waypoint is the start position, so there is one duration less than waypoints
+    @classmethod
+    def from_waypoints(cls, waypoints, durations):
+        if len(durations) != len(waypoints) - 1:
+            raise ValueError("Expected one duration per segment")
+        motor_ids = list(waypoints[0])
+        times = np.concatenate(([0], np.cumsum(durations)))
+        positions = [[waypoint[motor_id] for motor_id in motor_ids] for waypoint in waypoints]
+        return cls(motor_ids, times, positions)
+
+    @property
+    def duration(self):
+        return self.times[-1] - self.times[0]
+
+    # Linearly interpolated positions at the times t (s), shape (len(t), n_motors)
+    # Times outside the trajectory are clamped to its first/last sample
+    def sample(self, t):
+        t = np.clip(np.asarray(t, dtype=float) + self.times[0], self.times[0], self.times[-1])
+        i = np.clip(np.searchsorted(self.times, t, side="right") - 1, 0, len(self.times) - 2)
+        frac = (t - self.times[i]) / (self.times[i + 1] - self.times[i])
+        return self.positions[i] + frac[:, None] * (self.positions[i + 1] - self.positions[i])
+
+
+# Streams a trajectory to the motors as position targets, one sync write per tick at a fixed rate
+# Setpoints are interpolated ahead of time in blocks of lookahead seconds, so each tick only indexes
+# a buffer and writes; a late tick sends the setpoint for the current time instead of replaying old ones
+# The motors run with profile_vel while streaming, their previous profile velocities are put back after
+class TrajectoryExecutor(QThread):
+
+    progress = pyqtSignal(float)  # Elapsed trajectory time (s)
+
+    def __init__(self, dnx, trajectory, rate=50, lookahead=0.5, profile_vel=0, mode="extpos"):
+        super().__init__()
+        self.dnx = dnx
+        self.trajectory = trajectory
+        self.period = 1 / rate
+        self.block = max(int(lookahead * rate), 1)
+        self.profile_vel = profile_vel  # 0 = no profile, the motors track the setpoints directly
+        self.mode = mode
+        self.running = True
+        self.completed = False
+
+    def run(self):
+        motor_ids = self.trajectory.motor_ids
+        self.dnx.set_modes({motor_id: self.mode for motor_id in motor_ids})
+        previous = self.dnx.get_profile_velocities(motor_ids)
+        try:
+            for motor_id in motor_ids:
+                self.dnx.set_profile_velocity(motor_id, self.profile_vel)
+            self._stream(motor_ids)
+        finally:
+            for motor_id, velocity in previous.items():
+                self.dnx.set_profile_velocity(motor_id, velocity)
+
+    def _stream(self, motor_ids):
+        n_ticks = int(np.ceil(self.trajectory.duration / self.period)) + 1
+        buffer = np.empty((0, len(motor_ids)), dtype=int)
+        buffer_start = 0
+        start = time.monotonic()
+        tick = 0
+        while self.running and tick < n_ticks:
+            if tick >= buffer_start + len(buffer):
+                buffer_start = tick
+                ticks = np.arange(tick, min(tick + self.block, n_ticks))
+                buffer = np.rint(self.trajectory.sample(ticks * self.period)).astype(int)
+            setpoint = buffer[tick - buffer_start]
+            try:
+                self.dnx.set_positions(dict(zip(motor_ids, setpoint)), self.mode)
+            except RuntimeError as e:
+                print(f"Trajectory write failed: {e}")
+            self.progress.emit(tick * self.period)
+
+            tick += 1
+            delay = start + tick * self.period - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            elif tick < n_ticks:
+                tick = min(int((time.monotonic() - start) / self.period), n_ticks - 1)  # Skip missed setpoints
+        self.completed = self.running
+
+    def stop(self):
+        self.running = False
@@ -0,0 +1,212 @@
+import math
+import threading
+import time
+from itertools import count
+
+try:
+    from motor_ctrl.bus_scheduler import priority, ESTOP
+except ImportError:  # Run as a script from src/motor_ctrl
+    from bus_scheduler import priority, ESTOP
+
+WHEEL_RESOLUTION = 0.01  # s per tick of the timer wheel
+WHEEL_SLOTS = 512  # Ticks per turn of the wheel, later timers wait in their slot for the turns in between
+STOP_BUFFER = 0.2  # s a timed move is stopped before its end, the old BUFF of set_dualvel/set_quadvel
+
+_wheel = None
+_wheel_lock = threading.Lock()
+
+
+# Hashed timer wheel: one thread fires any number of timers, each kept in the slot of its tick, so
+# scheduling and cancelling cost the same however many are pending; the thread sleeps while none are
+# Callbacks run on the wheel thread one after the other and should only be short bus writes
+class TimerWheel:
+
+    def __init__(self, resolution=WHEEL_RESOLUTION, slots=WHEEL_SLOTS):
+        self.resolution = resolution
+        self.slots = [{} for _ in range(slots)]  # {handle: (tick, callback, args)}
+        self.timers = {}  # {handle: slot}
+        self.handles = count(1)
+        self.start = time.monotonic()
+        self.done = 0  # Last tick fired
+        self.condition = threading.Condition()
+        self.thread = None
+
+    def _now(self):
+        return int((time.monotonic() - self.start) / self.resolution)
+
+    # Calls callback(*args) after delay (s), rounded up to the next tick; returns a handle for cancel()
+    def schedule(self, delay, callback, *args):
+        with self.condition:
+            tick = max(self._now(), self.done) + max(1, math.ceil(delay / self.resolution))
+            handle = next(self.handles)
+            slot = tick % len(self.slots)
+            self.slots[slot][handle] = (tick, callback, args)
+            self.timers[handle] = slot
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="timer-wheel", daemon=True)
+                self.thread.start()
+            self.condition.notify()
+        return handle
+
+    # Returns True if the timer was still pending
+    def cancel(self, handle):
+        with self.condition:
+            slot = self.timers.pop(handle, None)
+            if slot is None:
+                return False
+            del self.slots[slot][handle]
+            return True
+
+    def _due(self, now):
+        due = []
+        for tick in range(self.done + 1, min(now, self.done + len(self.slots)) + 1):
+            slot = self.slots[tick % len(self.slots)]
+            for handle, (timer_tick, callback, args) in list(slot.items()):
+                if timer_tick <= now:
+                    del slot[handle]
+                    del self.timers[handle]
+                    due.append((timer_tick, handle, callback, args))
+        self.done = now
+        return sorted(due)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                while not self.timers:
+                    self.done = self._now()
+                    self.condition.wait()
+                delay = (self.done + 1) * self.resolution - (time.monotonic() - self.start)
+                if delay > 0:
+                    self.condition.wait(delay)
+                due = self._due(self._now())
+            for _, _, callback, args in due:
+                try:
+                    callback(*args)
+                except Exception as e:
+                    print(f"Timer callback failed: {e}")
+
+
+# Timer wheel shared by every driver of the process, started with its first timer
+def timer_wheel():
+    global _wheel
+    with _wheel_lock:
+        if _wheel is None:
+            _wheel = TimerWheel()
+        return _wheel
+
+
+# Velocity safety and timed moves of a Dynamixel* driver, fed by its set_velocity/set_velocities
+# With a timeout, a motor left moving without a new velocity command for that long is zeroed; the
+# motors that expire on the same tick are stopped in one batched write at ESTOP priority
+# Timed moves (run_for) schedule their stop on the wheel instead of sleeping in the caller
+class VelocityWatchdog:
+
+    def __init__(self, dnx, timeout=None, wheel=None):
+        self.dnx = dnx
+        self.timeout = timeout  # s, None = motors keep their velocity until told otherwise
+        self.wheel = wheel
+        self.deadlines = {}  # {motor_id: wheel handle} of the moving motors
+        self.expired = set()
+        self.flush_pending = False
+        self.timed = {}  # {motor_id: token of the timed move in charge of it}
+        self.stats = {"commands": 0, "expired": 0, "timed": 0}
+        self.lock = threading.Lock()
+
+    def _wheel(self):
+        if self.wheel is None:
+            self.wheel = timer_wheel()
+        return self.wheel
+
+    def set_timeout(self, timeout):
+        with self.lock:
+            self.timeout = timeout
+            moving = list(self.deadlines)
+        for motor_id in moving:
+            self._arm(motor_id, 1)
+
+    # Restarts the deadline of a motor given a velocity, a zero velocity or no timeout clears it
+    def _arm(self, motor_id, velocity):
+        with self.lock:
+            handle = self.deadlines.pop(motor_id, None)
+            if velocity and self.timeout is not None:
+                self.deadlines[motor_id] = self._wheel().schedule(self.timeout, self._expire, motor_id)
+        if handle is not None:
+            self._wheel().cancel(handle)
+
+    # Called by the driver after each velocity write; the latest command takes a motor over from a timed move
+    def touch(self, velocities):
+        if self.timeout is None and not self.deadlines and not self.timed:
+            return
+        with self.lock:
+            self.stats["commands"] += 1
+            for motor_id in velocities:
+                self.timed.pop(motor_id, None)
+        for motor_id, velocity in velocities.items():
+            self._arm(motor_id, velocity)
+
+    def _expire(self, motor_id):
+        with self.lock:
+            self.deadlines.pop(motor_id, None)
+            self.expired.add(motor_id)
+            if self.flush_pending:
+                return
+            self.flush_pending = True
+        self._wheel().schedule(0, self._flush)
+
+    def _flush(self):
+        with self.lock:
+            expired = sorted(self.expired - set(self.deadlines))  # Motors commanded again since are left alone
+            self.expired.clear()
+            self.flush_pending = False
+            self.stats["expired"] += len(expired)
+        if expired:
+            with priority(ESTOP):
+                self.dnx.set_velocities({motor_id: 0 for motor_id in expired})
+            print(f"No velocity command for IDs {expired} in {self.timeout} s, stopped")
+
+    # Sets the velocities for duration (s) and returns at once; the motors are braked (or, without
+    # brake, freed for STOP_BUFFER) STOP_BUFFER before the end, unless commanded again before then
+    # Returns a threading.Event set when the move is over
+    def run_for(self, velocities, duration, brake=True):
+        done = threading.Event()
+        if duration < STOP_BUFFER:
+            print(f"Duration must be greater than {STOP_BUFFER}s")
+            with priority(ESTOP):
+                self.dnx.set_velocities({motor_id: 0 for motor_id in velocities})
+            done.set()
+            return done
+        self.dnx.set_velocities(velocities)
+        token = object()
+        with self.lock:
+            self.stats["timed"] += 1
+            for motor_id in velocities:
+                self.timed[motor_id] = token
+        for motor_id in velocities:
+            self._arm(motor_id, 0)  # The move's own stop replaces the deadline
+        self._wheel().schedule(duration - STOP_BUFFER, self._end_move, list(velocities), token, brake, done)
+        return done
+
+    def _end_move(self, motor_ids, token, brake, done):
+        with self.lock:
+            motor_ids = [motor_id for motor_id in motor_ids if self.timed.get(motor_id) is token]
+            for motor_id in motor_ids:
+                del self.timed[motor_id]
+        if motor_ids and not brake:
+            try:
+                self.dnx.disable_torques(motor_ids)
+                self.dnx.set_velocities({motor_id: 0 for motor_id in motor_ids})  # Coasts, and stays still once enabled again
+            finally:
+                self._wheel().schedule(STOP_BUFFER, self._release, motor_ids, done)
+            return
+        try:
+            if motor_ids:
+                with priority(ESTOP):
+                    self.dnx.set_velocities({motor_id: 0 for motor_id in motor_ids})
+        finally:
+            done.set()
+
+    def _release(self, motor_ids, done):
+        try:
+            self.dnx.enable_torques(motor_ids)
+        finally:
+            done.set()
@@ -1,27 +1,34 @@
 
-import json
+import os
 import serial
+import sys
 import threading
 import time
 
 import numpy as np
 from PyQt5.QtCore import QThread
+try:
+    from motor_ctrl.config import ConfigFile
+except ImportError:  # Run as a script from src/opten_ctrl
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from motor_ctrl.config import ConfigFile
 
-# Load configuration from JSON file
-with open('src/opten_ctrl/opten_config.json', 'r') as config_file:
-    config = json.load(config_file)
+# Configuration from opten_config.json next to this file, only read when one of CONFIG_NAMES is first used
+CONFIG = ConfigFile('opten_config.json', {f"OPTEN{i}_ID": str for i in range(1, 5)}, base=os.path.dirname(os.path.abspath(__file__)))
+CONFIG_NAMES = ["OPTEN_IDS", "OPTEN1_ID", "OPTEN2_ID", "OPTEN3_ID", "OPTEN4_ID"]
 
-# Extract settings from the config dictionary
-OPTEN_IDS = {
-    "OPTEN1_ID": config['OPTEN1_ID'],
-    "OPTEN2_ID": config['OPTEN2_ID'],
-    "OPTEN3_ID": config['OPTEN3_ID'],
-    "OPTEN4_ID": config['OPTEN4_ID']
-}
-OPTEN1_ID = OPTEN_IDS["OPTEN1_ID"]
-OPTEN2_ID = OPTEN_IDS["OPTEN2_ID"]
-OPTEN3_ID = OPTEN_IDS["OPTEN3_ID"]
-OPTEN4_ID = OPTEN_IDS["OPTEN4_ID"]
+# Sets OPTEN_IDS and OPTEN<n>_ID from the config, parsed again if the file changed
+def load_config():
+    config = CONFIG.load()
+    opten_ids = {f"OPTEN{i}_ID": config[f"OPTEN{i}_ID"] for i in range(1, 5)}
+    globals().update(opten_ids, OPTEN_IDS=opten_ids)
+
+# Module attributes not set yet (PEP 562), so importing this module reads no file
+def __getattr__(name):
+    if name in CONFIG_NAMES:
+        load_config()
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 BAUDRATE = 9600
 
@@ -41,6 +48,7 @@ class SerialReader(QThread):
         self.running = True
         self.initialised = False
         self.lock = threading.Lock()
+        self.listeners = [] # Called with (time, dx, dy, x, y) for every burst sample, e.g. to log it
 
     def run(self):
         while self.running:
@@ -78,6 +86,9 @@ class SerialReader(QThread):
                 with self.lock:
                     self.x += dx * 25.4 / self.dpi # Convert dpi to counts/mm
                     self.y += dy * 25.4 / self.dpi # Convert dpi to counts/mm
+                    x, y = self.x, self.y
+                for listener in self.listeners:
+                    listener(time.monotonic(), dx * 25.4 / self.dpi, dy * 25.4 / self.dpi, x, y)
                     
             elif self.mode == "camera":
                 raw = input_line.split(' ')
@@ -91,6 +102,7 @@ class SerialReader(QThread):
 class Optical4:
     
     def __init__(self):
+        load_config()
         self.port1 = OPTEN1_ID
         self.port2 = OPTEN2_ID
         self.port3 = OPTEN3_ID